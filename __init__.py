@@ -119,8 +119,9 @@ class ModalModularTreedOperator(Operator):
             level = get_change_level(new_memory, self.node.memory)
             if level != "unchanged":
                 print(level)
-                delete_old_tree(level)
                 self.node.memory = new_memory
+                if level == "gen" and not self.node.check_budget(self):
+                    return {'PASS_THROUGH'}
                 self.tree = self.node.execute(level, self.tree)
                 if self.tree is None:
                     self.report({'ERROR'}, "Invalid Node Tree")
@@ -132,10 +133,11 @@ class ModalModularTreedOperator(Operator):
     def execute(self, context):
         wm = context.window_manager
         self.node = bpy.context.active_node.id_data.nodes.get("BuildTree")
+        if not self.node.check_budget(self):
+            return {'CANCELLED'}
         self._timer = wm.event_timer_add(0.1, context.window)
         wm.modal_handler_add(self)
         self.node.auto_update = True
-        delete_old_tree(level="gen")
         self.tree = self.node.execute()
         # self.node = bpy.context.active_node.id_data.nodes.get("BuildTree")
         return {'RUNNING_MODAL'}
@@ -159,9 +161,10 @@ class MakeTreeFromNodes(Operator):
         pass
 
     def execute(self, context):
-        delete_old_tree()
         # node = bpy.data.node_groups.get("NodeTree.002").nodes.get("BuildTree")
         node = context.active_node.id_data.nodes.get("BuildTree")
+        if not node.check_budget(self):
+            return {'CANCELLED'}
         tree = node.execute()
         if tree is None:
             self.report({'ERROR'}, "Invalid Node Tree")
@@ -199,25 +202,6 @@ class VisualizeWithCurves(Operator):
         return {'FINISHED'}
 
 
-def delete_old_tree(level="gen"):
-    obj = bpy.context.object
-    bpy.ops.object.select_all(action='DESELECT')
-    if obj is not None:# and obj.select: #and obj.get("is_tree") is not None:
-        print(obj.select)
-        if level == "gen":
-            print("selecting")
-            obj.select = True
-        if obj.get("amt") is not None and level in {"amt", "gen"}:
-            amt = bpy.context.scene.objects.get(obj.get("amt"))
-            if amt is not None:
-                amt.select = True
-        if obj.get("emitter") is not None and level in {"emitter", "gen"}:
-            emitter = bpy.context.scene.objects.get(obj.get("emitter"))
-            if emitter is not None:
-                emitter.select = True
-    bpy.ops.object.delete(use_global=False)
-
-
 def register():
     addon_updater_ops.register(bl_info)
     nodeitems_utils.register_node_categories("MODULAR_TREE_NODES", node_categories)
@@ -0,0 +1,363 @@
+# The modules of a tree are stored in a TreeArena: one row per module, one contiguous array per field.
+# Links between modules are row indexes, -1 meaning that there is no module.
+# The free heads of the modules of the tree (the growth frontier) are kept up to date, grouped by creator.
+# Modules unlinked from the tree stay in the arena but are no longer alive and have no free heads.
+# This file only depends on numpy, the Module compatible views of the rows are defined in skeleton.py
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from . import geometry
+from .rng import child_uid
+
+
+ROOT, BRANCH, SPLIT, TRANSITION = range(4)
+TYPE_NAMES = ('root', 'branch', 'split', 'transition')
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+HEADS_NUMBER = (1, 1, 2, 1)
+ALL_CREATORS = -1  # selection bitmask with every creator bit set
+
+# name: (dtype, shape of one row)
+FIELDS = {"type": (np.int8, ()),
+          "parent": (np.int32, ()),
+          "head": (np.int32, (2,)),
+          "position": (np.float32, (3,)),
+          "direction": (np.float32, (3,)),
+          "radius": (np.float32, ()),
+          "head_radius": (np.float32, (2,)),
+          "head_length": (np.float32, (2,)),
+          "angle": (np.float32, (2,)),
+          "spin": (np.float32, ()),
+          "creator": (np.int16, ()),
+          "uid": (np.uint64, ()),
+          "resolution": (np.int8, ()),
+          "draw_base": (np.bool_, ()),
+          "alive": (np.bool_, ()),
+          "starting_index": (np.int32, ()),
+          "uv_height": (np.float32, ())}
+
+# Skeleton files start with MAGIC, the byte size of a json header and the header, padded to ALIGNMENT.
+# The header gives the offset of each field, stored as raw little endian rows so that they can be memory mapped.
+MAGIC = b"MTSKEL01"
+ALIGNMENT = 64
+
+
+class TreeArena:
+    """Structure of arrays holding every module of a tree"""
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.capacity = 0
+        self.creators = []
+        self.creator_codes = dict()
+        self.density_dict = dict()
+        self.frontier = dict()
+        for name, (dtype, shape) in FIELDS.items():
+            setattr(self, name, np.empty((0,) + shape, dtype=dtype))
+        self.reserve(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity):
+        """Makes sure that capacity modules can be stored without reallocating the arrays"""
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name, (dtype, shape) in FIELDS.items():
+            new_array = np.empty((capacity,) + shape, dtype=dtype)
+            new_array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, new_array)
+        self.capacity = capacity
+
+    def creator_code(self, creator):
+        """Returns the integer id of a creator name, registering it if needed"""
+        code = self.creator_codes.get(creator)
+        if code is None:
+            code = len(self.creators)
+            self.creators.append(creator)
+            self.creator_codes[creator] = code
+        return code
+
+    def creator_mask(self, selection):
+        """Returns the bitmask of the creator codes of selection, a list of creator names. Empty or None selects all"""
+        if selection is None or len(selection) == 0:
+            return ALL_CREATORS
+        mask = 0
+        for name in selection:
+            code = self.creator_codes.get(name)
+            if code is not None:
+                mask |= 1 << code
+        return mask
+
+    def selected(self, mask):
+        """Returns the boolean array telling which modules were made by the creators of mask"""
+        lookup = np.array([mask >> code & 1 for code in range(len(self.creators))], dtype=bool)
+        return lookup[self.creator[:self.count]]
+
+    def set_creator(self, index, creator):
+        """Changes the creator of a module, moving its free heads to the frontier of the new creator"""
+        slots = [h for h in range(HEADS_NUMBER[self.type[index]]) if self.head[index, h] < 0 and self.alive[index]]
+        for h in slots:
+            self.close_slot(index, h)
+        self.creator[index] = self.creator_code(creator)
+        for h in slots:
+            self.open_slot(index, h)
+
+    def open_slot(self, index, head):
+        self.frontier.setdefault(int(self.creator[index]), dict())[(index, head)] = None
+
+    def close_slot(self, index, head):
+        self.frontier.get(int(self.creator[index]), dict()).pop((index, head), None)
+
+    def extremities(self, mask=ALL_CREATORS):
+        """Returns the sorted (index, head) pairs of the free heads of the modules made by the creators of mask"""
+        slots = []
+        for code, creator_slots in self.frontier.items():
+            if mask >> code & 1:
+                slots.extend(creator_slots)
+        slots.sort()
+        return slots
+
+    def add(self, module, parent=-1, head=0):
+        """Stores a module and the modules it is linked to, then links it to the head of parent.
+
+        module can be a plain Module or a view of a row of this arena, in which case it is only relinked.
+        The module previously linked to the head of parent, if any, is dropped with what remains of its subtree.
+        Returns the index of the module.
+        """
+        result = -1
+        replaced = []
+        stack = [(module, parent, head)]
+        while len(stack) > 0:
+            module, parent, head = stack.pop()
+            alive = parent < 0 or bool(self.alive[parent])
+            if getattr(module, "arena", None) is self:
+                index = module.index
+                self.set_alive(index, alive)
+            else:
+                index = self.append(module, alive)
+                for child_head, child in enumerate((module.head_module_1, module.head_module_2)):
+                    if child is not None:
+                        stack.append((child, index, child_head))
+            self.parent[index] = parent
+            if parent >= 0:
+                old = self.head[parent, head]
+                if old >= 0 and old != index:
+                    replaced.append((old, parent))
+                self.head[parent, head] = index
+                self.close_slot(parent, head)
+            if result < 0:
+                result = index
+        for old, parent in replaced:
+            if self.parent[old] == parent:
+                self.set_alive(old, False)
+        return result
+
+    def extend(self, parents, heads, types, creator, **fields):
+        """Appends one module per (parent, head) pair and links it to that head, which must be free.
+        fields gives the values of the fields of the new modules, the fields left out are zero. The modules get the
+        ids matching their position. Returns the indexes of the new modules.
+        """
+        parents, heads = np.asarray(parents, dtype=int), np.asarray(heads, dtype=int)
+        start = self.count
+        self.reserve(start + len(parents))
+        self.count += len(parents)
+        indexes = np.arange(start, self.count)
+        for name in FIELDS:
+            getattr(self, name)[indexes] = fields.get(name, 0)
+        self.type[indexes] = types
+        self.parent[indexes] = parents
+        self.head[indexes] = -1
+        self.creator[indexes] = self.creator_code(creator)
+        self.uid[indexes] = [child_uid(uid, head) for uid, head in zip(self.uid[parents].tolist(), heads.tolist())]
+        self.alive[indexes] = self.alive[parents]
+        self.head[parents, heads] = indexes
+        for index, parent, head in zip(indexes.tolist(), parents.tolist(), heads.tolist()):
+            self.close_slot(parent, head)
+            if self.alive[index]:
+                for h in range(HEADS_NUMBER[self.type[index]]):
+                    self.open_slot(index, h)
+        return indexes
+
+    def head_frames(self, indexes, heads):
+        """Returns the positions and directions of heads of modules, where the modules linked to them start"""
+        indexes, heads = np.asarray(indexes, dtype=int), np.asarray(heads, dtype=int)
+        types = self.type[indexes]
+        positions = self.position[indexes].astype(float)
+        directions = self.direction[indexes].astype(float)
+        splits = types == SPLIT
+        if splits.any():
+            angles = self.angle[indexes[splits]].astype(float)
+            angle = angles[:, 0] - np.where(heads[splits] == 1, angles[:, 1], 0)
+            directions[splits] = geometry.get_direction(directions[splits], angle, self.spin[indexes[splits]].astype(float))
+        lengths = np.where(types == ROOT, 0, self.head_length[indexes, heads].astype(float))
+        return positions + directions * lengths[:, None], directions
+
+    def detach(self, index, head):
+        """Unlinks the module attached to a head of index and drops its subtree"""
+        old = self.head[index, head]
+        self.head[index, head] = -1
+        if self.alive[index]:
+            self.open_slot(index, head)
+        if old >= 0 and self.parent[old] == index:
+            self.set_alive(old, False)
+
+    def set_alive(self, index, alive):
+        """Marks a module and the modules it still owns as linked to the tree or not, updating the frontier.
+        Modules that were relinked to another parent are left untouched.
+        """
+        stack = [index]
+        while len(stack) > 0:
+            index = stack.pop()
+            if self.alive[index] == alive:
+                continue
+            self.alive[index] = alive
+            for h in range(HEADS_NUMBER[self.type[index]]):
+                child = self.head[index, h]
+                if child >= 0 and self.parent[child] == index:
+                    stack.append(child)
+                elif child < 0 and alive:
+                    self.open_slot(index, h)
+                elif child < 0:
+                    self.close_slot(index, h)
+
+    def rebuild_frontier(self, root):
+        """Recomputes the frontier from the modules reachable from root. Raises ValueError when the links do not make
+        a tree, so that a corrupted skeleton cannot be walked forever
+        """
+        self.frontier = dict()
+        self.alive[:self.count] = False
+        if not 0 <= root < self.count:
+            raise ValueError("the root is out of the arena")
+        generation = np.array([root])
+        while len(generation) > 0:
+            if self.alive[generation].any() or len(np.unique(generation)) < len(generation):
+                raise ValueError("a module is linked to several heads, the modules do not make a tree")
+            self.alive[generation] = True
+            free = self.head[generation] < 0
+            free[:, 1] &= self.type[generation] == SPLIT
+            rows, heads = np.nonzero(free)
+            for index, head in zip(generation[rows].tolist(), heads.tolist()):
+                self.open_slot(index, head)
+            children = self.head[generation]
+            if children.max() >= self.count:
+                raise ValueError("a module is linked to a module out of the arena")
+            # like set_alive, only the modules still owned by the module are followed
+            owned = (children >= 0) & (self.parent[np.maximum(children, 0)] == generation[:, None])
+            generation = children[owned]
+
+    def append(self, module, alive=True):
+        """Copies the fields of a plain Module in a new row, without its links. Returns the index of the row"""
+        index = self.count
+        self.reserve(index + 1)
+        self.count += 1
+        code = TYPE_CODES[module.type]
+        self.type[index] = code
+        self.parent[index] = -1
+        self.head[index] = -1
+        self.position[index] = tuple(module.position)
+        self.direction[index] = tuple(module.direction)
+        self.radius[index] = module.base_radius
+        self.head_radius[index] = module.head_1_radius, getattr(module, "head_2_radius", 0)
+        if code == SPLIT:
+            self.head_length[index] = module.head_1_length, module.head_2_length
+            self.angle[index] = module.primary_angle, module.secondary_angle
+        else:
+            self.head_length[index] = getattr(module, "length", 0), 0
+            self.angle[index] = 0
+        self.spin[index] = module.spin
+        self.creator[index] = self.creator_code(module.creator)
+        self.uid[index] = module.uid
+        self.resolution[index] = module.resolution
+        self.draw_base[index] = getattr(module, "draw_base", False)
+        self.alive[index] = alive
+        self.starting_index[index] = module.starting_index
+        self.uv_height[index] = module.uv_height
+        if alive:
+            for head in range(HEADS_NUMBER[code]):
+                self.open_slot(index, head)
+        return index
+
+    def save(self, filepath, root=0):
+        """Writes the modules of the arena to a skeleton file, root being the index of the root module.
+        The file is written next to filepath and then moved over it, so a skeleton can be saved over the file it was
+        loaded from.
+        """
+        # fields mapped from a file are read before the file is replaced
+        for name in FIELDS:
+            array = getattr(self, name)
+            if isinstance(array, np.memmap):
+                setattr(self, name, np.array(array))
+        header = {"count": self.count, "root": root, "creators": self.creators,
+                  "density": [[list(key), value] for key, value in self.density_dict.items()], "fields": {}}
+        offset = 0
+        for name, (dtype, shape) in FIELDS.items():
+            dtype = np.dtype(dtype).newbyteorder('<')
+            header["fields"][name] = [dtype.str, list(shape), offset]
+            offset += aligned(self.count * dtype.itemsize * int(np.prod(shape)))
+        size = offset
+        data = json.dumps(header).encode()
+        start = aligned(len(MAGIC) + 4 + len(data))
+        temporary_path = filepath + ".tmp"
+        with open(temporary_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(data)) + data)
+            for name, (dtype_str, shape, offset) in header["fields"].items():
+                f.seek(start + offset)
+                f.write(np.ascontiguousarray(getattr(self, name)[:self.count], dtype=dtype_str).tobytes())
+            f.truncate(start + size)
+        os.replace(temporary_path, filepath)
+
+
+def aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def load(filepath, mmap=True):
+    """Reads a skeleton file written by TreeArena.save. Returns (arena, root index).
+
+    With mmap the fields are mapped copy-on-write: nothing is read before it is used and changes stay in memory.
+    Raises ValueError when the file is not a valid skeleton.
+    """
+    file_size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a modular tree skeleton".format(filepath))
+        size = struct.unpack('<I', f.read(4))[0]
+        try:
+            header = json.loads(f.read(size).decode())
+            count, root = int(header["count"]), int(header["root"])
+            fields = header["fields"]
+            creators = [str(creator) for creator in header["creators"]]
+            density = {tuple(key): float(value) for key, value in header["density"]}
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("{} has an invalid header".format(filepath))
+    start = aligned(len(MAGIC) + 4 + size)
+    if not 0 <= root < count:
+        raise ValueError("{} has no root module".format(filepath))
+
+    arena = TreeArena(capacity=0)
+    for name, (dtype, shape) in FIELDS.items():
+        if name not in fields:
+            setattr(arena, name, np.zeros((count,) + shape, dtype=dtype))
+            continue
+        dtype_str, stored_shape, offset = fields[name]
+        shape = (count,) + tuple(stored_shape)
+        if tuple(stored_shape) != FIELDS[name][1] or start + offset + count * np.dtype(dtype_str).itemsize * int(np.prod(stored_shape)) > file_size:
+            raise ValueError("{} is truncated or has an invalid {} field".format(filepath, name))
+        if mmap and count > 0:
+            array = np.memmap(filepath, dtype=dtype_str, mode='c', offset=start + offset, shape=shape)
+        else:
+            array = np.fromfile(filepath, dtype=dtype_str, count=int(np.prod(shape)), offset=start + offset).reshape(shape)
+        setattr(arena, name, array.astype(dtype, copy=False))
+    arena.count = arena.capacity = count
+    for creator in creators:
+        arena.creator_code(creator)
+    if (arena.type.min() < 0 or arena.type.max() >= len(TYPE_NAMES) or arena.head.min() < -1 or
+            arena.head.max() >= count or arena.parent.min() < -1 or arena.parent.max() >= count or arena.creator.min() < 0 or arena.creator.max() >= len(arena.creators)):
+        raise ValueError("{} has modules with invalid types, links or creators".format(filepath))
+    arena.density_dict = density
+    arena.rebuild_frontier(root)
+    return arena, root
@@ -0,0 +1,322 @@
+# Batched construction of the geometry of the modules of a TreeArena.
+# All the modules of one generation (the children of the previous one) are built at once with numpy.
+# Branches drawing their own base, because their parent is in a higher resolution level, are built as transitions.
+
+import numpy as np
+from math import pi
+
+from .arena import ROOT, BRANCH, SPLIT, TRANSITION
+from . import geometry, topology
+
+
+# shift of the ring of a module turned by spin_diff relative to its parent, indexed by int(4*spin_diff/pi) % 8
+SHIFTS = np.array([0, -1, -1, -2, -2, -3, -3, 0])
+MAX_VERTS = 14
+# faces of each type of module built on a ring, caps excluded
+RING_FACES_NUMBER = np.array([0] + [len(topology.TEMPLATES[(module_type, 0, 0)]) for module_type in (BRANCH, SPLIT, TRANSITION)])
+
+
+def radius_correction(resolution):
+    return 1 - .25 ** (np.asarray(resolution) + 1)
+
+
+def ring_variant(spin_diff):
+    """Returns by how much the ring of a module turned by spin_diff is rolled"""
+    return -SHIFTS[np.trunc(4 * np.asarray(spin_diff) / pi).astype(int) % 8]
+
+
+def build_types(arena, modules):
+    """Returns the type of the geometry of modules, TRANSITION for branches drawing their base"""
+    types = arena.type[modules].copy()
+    types[(types == BRANCH) & arena.draw_base[modules]] = TRANSITION
+    return types
+
+
+def verts_number(arena, modules):
+    types = build_types(arena, modules)
+    result = np.full(len(modules), 4)
+    result[types == SPLIT] = 8
+    result[types == TRANSITION] = 14
+    return result
+
+
+def faces_number(arena, modules):
+    """Returns the number of faces of modules, caps included"""
+    types = build_types(arena, modules)
+    caps = arena.head[modules] < 0
+    caps[:, 1] &= types == SPLIT
+    return RING_FACES_NUMBER[types] + caps.sum(axis=1)
+
+
+def head_ring_offset(arena, modules, heads):
+    """Returns the index of the first vertex of the head rings, relative to the starting index of the modules"""
+    types = build_types(arena, modules)
+    result = np.zeros(len(modules), dtype=int)
+    result[types == SPLIT] = 4 * heads[types == SPLIT]
+    result[types == TRANSITION] = 8
+    return result
+
+
+def allocate(counts, resolutions, levels_count):
+    """Returns the position of each item in the buffer of its resolution level, and moves levels_count forward"""
+    starts = np.empty(len(counts), dtype=int)
+    for resolution in np.unique(resolutions):
+        selection = resolutions == resolution
+        level_counts = counts[selection]
+        starts[selection] = levels_count[resolution] + np.cumsum(level_counts) - level_counts
+        levels_count[resolution] += level_counts.sum()
+    return starts
+
+
+def base_rings(arena, parents, heads, modules):
+    """Returns the indexes of the head rings of parents the modules are built on, in the resolution level of the
+    parents, and the roll of each ring (0 to 3). Rolled ring vertex k, ring[(k - roll) % 4], is below head vertex k.
+    """
+    spin_diff = arena.spin[modules].astype(float) - arena.spin[parents]
+    spin_diff[arena.type[parents] == SPLIT] %= 2*pi
+    rings = (arena.starting_index[parents] + head_ring_offset(arena, parents, heads))[:, None] + np.arange(4)
+    return rings, ring_variant(spin_diff)
+
+
+def rolled(rings, rolls):
+    return rings[np.arange(len(rings))[:, None], (np.arange(4) - rolls[:, None]) % 4]
+
+
+def apply_resolution(arena, root, resolution_levels, max_radius):
+    """Gives its resolution level to every module below root, the root being in the highest one.
+    A module is at most one level below its parent and thinner modules are in lower levels, but only branches following
+    a branch change level: they draw their own base, which matches the ring of their parent.
+    """
+    arena.resolution[root] = resolution_levels
+    for parents, heads in generations(arena, root):
+        modules = arena.head[parents, heads]
+        parent_resolutions = arena.resolution[parents].astype(int)
+        resolutions = np.maximum(parent_resolutions - 1,
+                                 (resolution_levels * arena.radius[modules].astype(float) / max_radius + .6).astype(int))
+        linear = (arena.type[modules] == BRANCH) & (arena.type[parents] == BRANCH)
+        arena.resolution[modules] = np.where(linear, resolutions, parent_resolutions)
+        draw_base = linear & (resolutions < parent_resolutions)
+        arena.draw_base[modules[linear]] = draw_base[linear]
+        arena.direction[modules[draw_base]] = arena.direction[parents[draw_base]]
+
+
+def geometry_size(arena, root, resolution_levels):
+    """Returns the number of vertices and faces of each resolution level, caps included, once apply_resolution gave
+    their level to the modules below root"""
+    levels_verts = np.zeros(resolution_levels + 1, dtype=int)
+    levels_faces = np.zeros(resolution_levels + 1, dtype=int)
+    levels_verts[arena.resolution[root]] += 4
+    for parents, heads in generations(arena, root):
+        modules = arena.head[parents, heads]
+        resolutions = arena.resolution[modules].astype(int)
+        np.add.at(levels_verts, resolutions, verts_number(arena, modules))
+        np.add.at(levels_faces, resolutions, faces_number(arena, modules))
+    return levels_verts, levels_faces
+
+
+def build_generation(arena, parents, heads, verts_count, levels_verts=None):
+    """Builds the modules linked to the heads of parents, whose geometry must already be built.
+
+    Radii are corrected for subdivision, and starting indexes and uv heights are written to the arena.
+    verts_count holds the number of vertices already used in each resolution
+    level and is updated. levels_verts holds the vertices of each level, transitions are built on the actual head
+    rings of their parents when it is given.
+    Returns (modules, verts, verts_number, faces, uvs, faces_number, head_directions) where verts has shape
+    (n, MAX_VERTS, 3) and faces and uvs are laid out like in topology.build_topology.
+    """
+    modules = arena.head[parents, heads]
+    types = build_types(arena, modules)
+    parent_types = arena.type[parents]
+    resolutions = arena.resolution[modules].astype(int)
+    n = len(modules)
+
+    correction = radius_correction(resolutions).astype(np.float32)
+    arena.radius[modules] *= correction
+    arena.head_radius[modules] *= correction[:, None]
+
+    numbers = verts_number(arena, modules)
+    starts = allocate(numbers, resolutions, verts_count)
+    arena.starting_index[modules] = starts
+
+    # uv heights continue along branches, restart at the root and are kept after splits
+    is_linear = (parent_types == BRANCH) | (parent_types == TRANSITION)
+    uv_heights = arena.uv_height[modules]
+    uv_heights[parent_types == ROOT] = 0
+    uv_heights[is_linear] = (arena.uv_height[parents] + .1 * arena.head_length[parents, 0] / arena.radius[parents])[is_linear]
+    arena.uv_height[modules] = uv_heights
+
+    rings, variants = base_rings(arena, parents, heads, modules)
+
+    positions = arena.position[modules].astype(float)
+    directions = arena.direction[modules].astype(float)
+    spins = arena.spin[modules].astype(float)
+    radii = arena.radius[modules].astype(float)
+    head_radii = arena.head_radius[modules].astype(float)
+    head_lengths = arena.head_length[modules].astype(float)
+    angles = arena.angle[modules].astype(float)
+
+    verts = np.zeros((n, MAX_VERTS, 3))
+    head_directions = np.repeat(directions[:, None], 2, axis=1)
+
+    branches = types == BRANCH
+    if branches.any():
+        verts[branches, :4] = geometry.branch_verts(positions[branches], directions[branches], radii[branches],
+                                                    head_radii[branches, 0], head_lengths[branches, 0], spins[branches])
+
+    splits = types == SPLIT
+    if splits.any():
+        split_verts = geometry.split_verts(positions[splits], directions[splits], head_radii[splits, 0],
+                                           head_radii[splits, 1], head_lengths[splits, 0], head_lengths[splits, 1],
+                                           angles[splits, 0], angles[splits, 1], spins[splits])
+        verts[splits, :8] = split_verts
+        head_directions[splits, 0] = (split_verts[:, 3] + split_verts[:, 1]) / 2 - positions[splits]
+        head_directions[splits, 1] = (split_verts[:, 7] + split_verts[:, 5]) / 2 - positions[splits]
+
+    transitions = types == TRANSITION
+    if transitions.any():
+        base_ring = None
+        if levels_verts is not None:
+            ring_indexes = rolled(rings[transitions], variants[transitions])
+            parent_resolutions = arena.resolution[parents[transitions]]
+            base_ring = np.empty(ring_indexes.shape + (3,))
+            for resolution in np.unique(parent_resolutions):
+                selection = parent_resolutions == resolution
+                base_ring[selection] = levels_verts[resolution][ring_indexes[selection]]
+        verts[transitions] = geometry.transition_verts(positions[transitions], directions[transitions],
+                                                       radii[transitions], head_radii[transitions, 0],
+                                                       head_lengths[transitions, 0], spins[transitions], base_ring)
+        variants[transitions] = 0
+
+    free_heads = arena.head[modules] < 0
+    caps = free_heads[:, 0] | ((types == SPLIT) & free_heads[:, 1]) << 1
+    uv_lengths = .1 * head_lengths / np.where(types == SPLIT, head_radii.T, radii).T
+    faces, uvs, faces_number = topology.build_topology(types, variants, caps.astype(int), rings, starts,
+                                                       uv_heights.astype(float), uv_lengths)
+
+    return modules, verts, numbers, faces, uvs, faces_number, head_directions
+
+
+def scatter(buffers, values, numbers, starts, resolutions):
+    """Copies the first numbers[i] rows of values[i] to buffers[resolutions[i]] at starts[i]"""
+    valid = np.arange(values.shape[1]) < numbers[:, None]
+    destinations = starts[:, None] + np.arange(values.shape[1])
+    for resolution in np.unique(resolutions):
+        selection = (resolutions == resolution)[:, None] & valid
+        buffers[resolution][destinations[selection]] = values[selection]
+
+
+def generations(arena, root):
+    """Yields the (parents, heads) arrays of each generation of modules below root, in breadth first order"""
+    generation = np.array([root])
+    while len(generation) > 0:
+        rows, heads = np.nonzero(arena.head[generation] >= 0)
+        if len(rows) == 0:
+            return
+        parents = generation[rows]
+        yield parents, heads
+        generation = arena.head[parents, heads]
+
+
+def preview_selection(arena, root, min_radius=0, budget=0):
+    """Returns which modules are shown in the preview and the number of modules below root.
+
+    Modules thinner than min_radius are hidden with everything they carry. When more than budget modules remain,
+    the radius threshold is raised to keep the budget thickest ones, and ties are cut in breadth first order.
+    """
+    generated = [np.array([root])]
+    for parents, heads in generations(arena, root):
+        generated.append(arena.head[parents, heads])
+    generated = np.concatenate(generated)
+
+    threshold = min_radius
+    if 0 < budget < len(generated):
+        radii = arena.radius[generated]
+        threshold = max(threshold, -np.partition(-radii, budget - 1)[budget - 1])
+    shown = np.zeros(len(arena), dtype=bool)
+    shown[root] = True
+    for parents, heads in generations(arena, root):
+        modules = arena.head[parents, heads]
+        shown[modules] = shown[parents] & (arena.radius[modules] >= threshold)
+    if budget > 0:
+        shown[generated[np.cumsum(shown[generated]) > budget]] = False
+    return shown, len(generated)
+
+
+def curve_chains(arena, root, shown=None):
+    """Flattens the tree below root in chains of modules, one per spline of the curve preview. A chain starts at the
+    root or at the secondary head of a split, whose position is its first point, and follows the first heads.
+    shown optionally tells which modules are part of the preview.
+    Returns the number of points of each chain, the positions and radii of the points chain after chain, and the uid
+    of the module starting each chain, which identifies it from one generation of the tree to the next.
+    """
+    starts = [np.array([root])]
+    chains = [np.zeros(1, dtype=int)]
+    orders = [np.zeros(1, dtype=int)]
+    points = [np.array([root])]
+    module_chain = np.zeros(len(arena), dtype=int)
+    module_order = np.zeros(len(arena), dtype=int)
+    chains_number = 1
+    for parents, heads in generations(arena, root):
+        if shown is not None:
+            selection = shown[arena.head[parents, heads]]
+            parents, heads = parents[selection], heads[selection]
+        modules = arena.head[parents, heads]
+        new = heads == 1
+        module_chain[modules] = module_chain[parents]
+        module_chain[modules[new]] = chains_number + np.arange(new.sum())
+        module_order[modules] = np.where(new, 1, module_order[parents] + 1)
+        chains_number += int(new.sum())
+        # the split starting a chain is its first point
+        chains.extend((module_chain[modules[new]], module_chain[modules]))
+        orders.extend((np.zeros(new.sum(), dtype=int), module_order[modules]))
+        points.extend((parents[new], modules))
+        starts.append(modules[new])
+
+    chains, orders, points = (np.concatenate(arrays) for arrays in (chains, orders, points))
+    order = np.lexsort((orders, chains))
+    points = points[order]
+    keys = arena.uid[np.concatenate(starts)]
+    return np.bincount(chains, minlength=chains_number), arena.position[points], arena.radius[points], keys
+
+
+def collapse_collinear(counts, positions, radii, max_angle):
+    """Removes the points where a chain turns by less than max_angle, so that nearly straight parts of branches are
+    drawn as single segments. The ends of the chains are kept. Returns the new counts, positions and radii.
+    """
+    chains = np.repeat(np.arange(len(counts)), counts)
+    kept = np.ones(len(positions), dtype=bool)
+    min_cos = np.cos(max_angle)
+    while True:
+        indexes = np.flatnonzero(kept)
+        points_chains = chains[indexes]
+        points = positions[indexes].astype(float)
+        candidates = np.zeros(len(indexes), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            turns = (geometry.normalize(points[1:-1] - points[:-2]) * geometry.normalize(points[2:] - points[1:-1])).sum(axis=1)
+        candidates[1:-1] = (points_chains[:-2] == points_chains[1:-1]) & (points_chains[1:-1] == points_chains[2:]) & (turns >= min_cos)
+        if not candidates.any():
+            break
+        # every other point of a run of candidates is removed, the next pass tests the others against kept points
+        starts = candidates & ~np.concatenate(([False], candidates[:-1]))
+        run_starts = np.flatnonzero(starts)[np.cumsum(starts) - 1]
+        removed = candidates & ((np.arange(len(candidates)) - run_starts) % 2 == 0)
+        kept[indexes[removed]] = False
+    return np.bincount(chains[kept], minlength=len(counts)), positions[kept], radii[kept]
+
+
+def skeleton_edges(arena, root, shown=None):
+    """Returns the modules below root in breadth first order, optionally only the shown ones, and the (parent, child)
+    edges linking them as indexes in that order
+    """
+    modules = [np.array([root])]
+    parents = [np.zeros(0, dtype=int)]
+    for generation_parents, heads in generations(arena, root):
+        if shown is not None:
+            selection = shown[arena.head[generation_parents, heads]]
+            generation_parents, heads = generation_parents[selection], heads[selection]
+        modules.append(arena.head[generation_parents, heads])
+        parents.append(generation_parents)
+    modules, parents = np.concatenate(modules), np.concatenate(parents)
+    order = np.empty(len(arena), dtype=int)
+    order[modules] = np.arange(len(modules))
+    return modules, np.column_stack((order[parents], np.arange(1, len(modules))))
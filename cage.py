@@ -0,0 +1,68 @@
+# Cage of the final mesh of a tree: the geometry of its modules before subdivision, one buffer per resolution level.
+# This file does not depend on blender, so that trees can be built and exported outside of it.
+
+import numpy as np
+
+from .arena import TRANSITION
+from .skeleton import ArenaModule, arena_tree
+from . import builder, geometry, streaming
+
+
+def build_cage(root, resolution_levels):
+    """Builds the geometry of the modules of the tree before subdivision, in one buffer per resolution level.
+    Returns the verts, faces, uvs, weights and face owners (module indexes) of each level, the welds between
+    levels and the branch depth of each module.
+    """
+    arena = root.arena
+    max_radius = root.base_radius
+    builder.apply_resolution(arena, root.index, resolution_levels, max_radius)
+
+    # first pass: the size of every resolution level is known before any module is built
+    verts_number, faces_number = builder.geometry_size(arena, root.index, resolution_levels)
+
+    verts = [np.empty((n, 3), dtype=np.float32) for n in verts_number]
+    faces = [np.empty((n, 4), dtype=np.int32) for n in faces_number]
+    uvs = [np.empty((n, 4, 2), dtype=np.float32) for n in faces_number]
+    weights = [np.empty(n, dtype=np.float32) for n in verts_number]
+    owners = [np.empty(n, dtype=np.int32) for n in faces_number]
+    depths = np.zeros(len(arena), dtype=np.int32)
+    verts_count = np.zeros(resolution_levels+1, dtype=int)
+    faces_count = np.zeros(resolution_levels+1, dtype=int)
+
+    # second pass: each generation of modules is built at once and written at the current offset of its level
+    root.starting_index = 0
+    verts[-1][:4] = geometry.root_verts(root.position, root.direction, root.base_radius, root.spin)
+    weights[-1][:4] = 1
+    verts_count[-1] = 4
+    welds = []
+    for parents, heads in builder.generations(arena, root.index):
+        modules, modules_verts, modules_verts_number, modules_faces, modules_uvs, modules_faces_number, head_directions = builder.build_generation(arena, parents, heads, verts_count, verts)
+        resolutions = arena.resolution[modules].astype(int)
+        # the branch depth grows by one on the secondary head of splits
+        depths[modules] = depths[parents] + (heads == 1)
+        transitions = builder.build_types(arena, modules) == TRANSITION
+        if transitions.any():
+            rings, rolls = builder.base_rings(arena, parents[transitions], heads[transitions], modules[transitions])
+            octagons = arena.starting_index[modules[transitions], None] + np.arange(8)
+            welds.append((arena.resolution[parents[transitions]], builder.rolled(rings, rolls),
+                          resolutions[transitions], octagons))
+        starts = arena.starting_index[modules]
+        builder.scatter(verts, modules_verts, modules_verts_number, starts, resolutions)
+        radii = np.repeat(arena.radius[modules, None] / max_radius, builder.MAX_VERTS, axis=1)
+        builder.scatter(weights, radii, modules_verts_number, starts, resolutions)
+        faces_starts = builder.allocate(modules_faces_number, resolutions, faces_count)
+        builder.scatter(faces, modules_faces, modules_faces_number, faces_starts, resolutions)
+        builder.scatter(uvs, modules_uvs, modules_faces_number, faces_starts, resolutions)
+        modules_owners = np.repeat(modules[:, None], modules_faces.shape[1], axis=1)
+        builder.scatter(owners, modules_owners, modules_faces_number, faces_starts, resolutions)
+
+    return verts, faces, uvs, weights, owners, welds, depths
+
+
+def export_obj(root, resolution_levels, filepath, chunk_size=1 << 16):
+    """Writes the final mesh of the tree to a wavefront obj file chunk by chunk, without creating any datablock"""
+    if not isinstance(root, ArenaModule):
+        root = arena_tree(root)
+    verts, faces, uvs, weights, owners, welds, depths = build_cage(root, resolution_levels)
+    chunks = streaming.chunks(verts, faces, uvs, weights, owners, welds, chunk_size)
+    streaming.assemble(chunks, streaming.ObjSink(filepath))
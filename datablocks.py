@@ -0,0 +1,90 @@
+# Ownership of the datablocks created by the add-on.
+# The datablocks made for a tree are recorded by name in a custom property of their owner (the BuildTree node, or
+# the tree object for the toolbar operators), so that the registry is saved with the .blend and survives undo.
+# After each regeneration the recorded datablocks that no longer have any user are removed, objects first so that
+# the data they were the last users of is released in the same pass.
+
+import bpy
+
+
+PROPERTY = "mtree_datablocks"
+
+# collection of bpy.data: type of the datablocks it holds, in the order in which orphans are released
+COLLECTIONS = (("objects", bpy.types.Object),
+               ("meshes", bpy.types.Mesh),
+               ("curves", bpy.types.Curve),
+               ("armatures", bpy.types.Armature),
+               ("particles", bpy.types.ParticleSettings),
+               ("textures", bpy.types.Texture))
+
+# approximate byte size of the DNA structs of blender 2.79 making most of the memory of each kind of datablock
+VERT_SIZE, EDGE_SIZE, LOOP_SIZE, POLY_SIZE, UV_SIZE = 20, 12, 8, 12, 12
+POINT_SIZE, BONE_SIZE, ID_SIZE = 36, 300, 1024
+
+
+def collection_name(datablock):
+    for name, datablock_type in COLLECTIONS:
+        if isinstance(datablock, datablock_type):
+            return name
+    return None
+
+
+def own(owner, *datablocks):
+    """Records that owner is responsible for datablocks. None datablocks are ignored"""
+    registry = owner.get(PROPERTY)
+    if registry is None:
+        owner[PROPERTY] = {}
+        registry = owner[PROPERTY]
+    for datablock in datablocks:
+        name = None if datablock is None else collection_name(datablock)
+        if name is None:
+            continue
+        if registry.get(name) is None:
+            registry[name] = {}
+        registry[name][datablock.name] = 1
+
+
+def owned(owner):
+    """Yields the (collection name, datablock) pairs recorded by owner that still exist"""
+    registry = owner.get(PROPERTY, {})
+    for name, datablock_type in COLLECTIONS:
+        collection = getattr(bpy.data, name)
+        for datablock_name in list(registry.get(name, {}).keys()):
+            datablock = collection.get(datablock_name)
+            if datablock is None:
+                del registry[name][datablock_name]
+            else:
+                yield name, datablock
+
+
+def datablock_size(datablock):
+    """Returns an estimate of the memory used by a datablock, in bytes"""
+    size = ID_SIZE
+    if isinstance(datablock, bpy.types.Mesh):
+        size += (VERT_SIZE * len(datablock.vertices) + EDGE_SIZE * len(datablock.edges) +
+                 (LOOP_SIZE + UV_SIZE * len(datablock.uv_layers)) * len(datablock.loops) +
+                 POLY_SIZE * len(datablock.polygons))
+    elif isinstance(datablock, bpy.types.Curve):
+        size += POINT_SIZE * sum(len(spline.points) + len(spline.bezier_points) for spline in datablock.splines)
+    elif isinstance(datablock, bpy.types.Armature):
+        size += BONE_SIZE * len(datablock.bones)
+    return size
+
+
+def reclaim(owner):
+    """Removes the datablocks recorded by owner that are no longer used. Returns the number of datablocks removed and
+    an estimate of the bytes freed
+    """
+    count = 0
+    size = 0
+    for name, datablock in owned(owner):
+        if datablock.users > 0 and not (name == "objects" and len(datablock.users_scene) == 0):
+            continue
+        size += datablock_size(datablock)
+        count += 1
+        del owner[PROPERTY][name][datablock.name]
+        if name == "objects":
+            getattr(bpy.data, name).remove(datablock, do_unlink=True)
+        else:
+            getattr(bpy.data, name).remove(datablock)
+    return count, size
@@ -0,0 +1,175 @@
+# Forecast of the size of a tree before it is grown.
+# Instead of growing modules one by one, the forecast follows cohorts: modules or free heads sharing a radius, a
+# creator and a resolution level, with the expected number of them. Each iteration of a grow node turns the cohorts of
+# selected free heads into modules, a part of them being splits, and into the cohorts of the next heads, thinner by the
+# radius decrease or the split radius. The levels follow builder.apply_resolution: splits and the modules they carry
+# keep the level of their parent, and a branch following a branch drops at most one level, drawing a transition.
+# Transitions are counted with the modules. The pruning, shape, up attraction and ground of grow nodes depend on where
+# the branches are and are left out. The forecast is the expected size of the tree, not a bound: it is larger than the
+# trees those settings prune, but a tree drawing more splits than expected is larger than its forecast.
+
+from math import ceil, inf
+
+import numpy as np
+
+from .arena import ROOT, BRANCH, SPLIT, TRANSITION
+
+
+# vertices and faces of each type of module before subdivision, caps excluded, by arena type code
+BASE_VERTS = np.array([4, 4, 8, 14])
+BASE_FACES = np.array([0, 4, 7, 8])
+# radii closer than this ratio are merged in one cohort
+RADIUS_PRECISION = 1e-3
+# growth is not followed further once the forecast reaches this many modules
+MAX_MODULES = 1e9
+
+
+def merge(radius, weight, *keys):
+    """Sums the weights of the cohorts of nearly same radius and same keys. Returns the merged radii, weights and keys"""
+    keep = (weight > 0) & (radius > 0)
+    codes = [np.round(np.log(radius[keep]) / RADIUS_PRECISION).astype(np.int64)]
+    values = []
+    for key in keys:
+        key_values, key_codes = np.unique(key[keep], return_inverse=True)
+        values.append(key_values)
+        codes.append(key_codes.ravel())
+    rows, inverse = np.unique(np.stack(codes, axis=1).reshape(-1, len(codes)), axis=0, return_inverse=True)
+    weights = np.bincount(inverse.ravel(), weights=weight[keep], minlength=len(rows))
+    merged_keys = [key_values[rows[:, i + 1]] for i, key_values in enumerate(values)]
+    return (np.exp(rows[:, 0] * RADIUS_PRECISION), weights) + tuple(merged_keys)
+
+
+def selected(creator, selection):
+    """Mask of the cohorts made by a creator of the selection, an empty selection selecting everything"""
+    if len(selection) == 0:
+        return np.ones(len(creator), dtype=bool)
+    return np.isin(creator, list(selection))
+
+
+def resolutions(radius, resolution_levels, max_radius):
+    """Resolution level matching the radius of modules, see builder.apply_resolution"""
+    return np.minimum(resolution_levels, (resolution_levels * radius / max_radius + .6).astype(int))
+
+
+class Forecast:
+    """Estimated modules and free heads of a tree, built by the same steps as the tree itself.
+    Free heads are told apart by the level of the module carrying them and whether it is a branch.
+    """
+    def __init__(self, resolution_levels=0):
+        self.resolution_levels = resolution_levels
+        self.radius = np.zeros(0)
+        self.weight = np.zeros(0)
+        self.kind = np.zeros(0, dtype=int)
+        self.level = np.zeros(0, dtype=int)
+        self.creator = np.zeros(0, dtype=object)
+        self.head_radius = np.zeros(0)
+        self.head_weight = np.zeros(0)
+        self.head_level = np.zeros(0, dtype=int)
+        self.head_linear = np.zeros(0, dtype=bool)
+        self.head_creator = np.zeros(0, dtype=object)
+        self.max_radius = 0
+
+    @property
+    def modules_number(self):
+        return self.weight.sum()
+
+    def add_modules(self, radius, weight, kind, level, creator):
+        radius = np.asarray(radius, dtype=float)
+        self.radius = np.concatenate((self.radius, radius))
+        self.weight = np.concatenate((self.weight, np.broadcast_to(weight, radius.shape)))
+        self.kind = np.concatenate((self.kind, np.broadcast_to(kind, radius.shape)))
+        self.level = np.concatenate((self.level, np.broadcast_to(level, radius.shape)))
+        self.creator = np.concatenate((self.creator, np.full(len(radius), creator, dtype=object)))
+
+    def add_heads(self, radius, weight, level, linear, creator):
+        radius = np.asarray(radius, dtype=float)
+        merged = merge(np.concatenate((self.head_radius, radius)),
+                       np.concatenate((self.head_weight, np.broadcast_to(weight, radius.shape))),
+                       np.concatenate((self.head_level, np.broadcast_to(level, radius.shape))),
+                       np.concatenate((self.head_linear, np.broadcast_to(linear, radius.shape))),
+                       np.concatenate((self.head_creator, np.full(len(radius), creator, dtype=object))))
+        self.head_radius, self.head_weight, self.head_level, self.head_linear, self.head_creator = merged
+
+    def branch_levels(self, radius, parent_level, linear):
+        """Levels of branches of radius linked to modules of parent_level, linear when the parents are branches, and
+        whether they draw a transition"""
+        target = resolutions(radius, self.resolution_levels, self.max_radius)
+        level = np.where(linear, np.maximum(parent_level - 1, target), parent_level)
+        return level, level < parent_level
+
+    def add_basic_trunk(self, radius, radius_decrease, height, branch_length):
+        """Forecast of growth.add_basic_trunk, the trunk being assumed straight"""
+        self.max_radius = radius
+        levels = self.resolution_levels
+        self.add_modules([radius], 1, ROOT, levels, "default")
+        branches = ceil(height / branch_length) + 1 if height > 0 else 0
+        level, linear = levels, False
+        for branch_radius in (radius * radius_decrease ** np.arange(branches)).tolist():
+            new_level, transition = self.branch_levels(np.array([branch_radius]), level, linear)
+            self.add_modules([branch_radius], 1, TRANSITION if transition[0] else BRANCH, new_level, "default")
+            level, linear = new_level[0], True
+        self.add_heads([radius * radius_decrease ** branches], 1, level, linear, "default")
+
+    def add_splits(self, proba, selection, creator, head_size):
+        """Forecast of growth.add_splits, the offset being left out"""
+        branches = np.flatnonzero(np.isin(self.kind, (BRANCH, TRANSITION)) & selected(self.creator, selection))
+        radius, weight = self.radius[branches], self.weight[branches]
+        # splits take the level of the parent of the branch they replace, one above it for transitions
+        level = self.level[branches] + (self.kind[branches] == TRANSITION)
+        # each split replaces a branch and skips the next one when its head is large enough, and a split drawn on the
+        # branch visited right after it is dropped, skipping branches all the same
+        skipped = int(head_size + .5) > 0
+        splits = weight * proba / (1 + proba * (1 + skipped * (1 + proba)))
+        self.weight[branches] = np.maximum(0, weight - splits * (1 + skipped))
+        self.add_modules(radius, splits, SPLIT, level, creator)
+        self.add_heads(radius * head_size, splits, level, False, creator)
+
+    def grow(self, iterations, min_radius, limit_method, split_proba, split_radius, radius_decrease, creator,
+             selection):
+        """Forecast of growth.grow without pruning"""
+        growing = selected(self.head_creator, selection)
+        radius, weight = self.head_radius[growing], self.head_weight[growing]
+        level, linear = self.head_level[growing], self.head_linear[growing]
+        self.head_radius, self.head_weight = self.head_radius[~growing], self.head_weight[~growing]
+        self.head_level, self.head_linear = self.head_level[~growing], self.head_linear[~growing]
+        self.head_creator = self.head_creator[~growing]
+        if limit_method == "iterations":
+            # grow runs one more iteration than asked, unless it is asked for none
+            remaining = iterations + 1 if iterations > 0 else 0
+        else:
+            # the heads get thinner at each iteration until all are below min_radius
+            remaining = inf
+        # the heads of each iteration are made by this grow, so only their radii and levels tell cohorts apart
+        modules = []
+        stopped = [(radius[:0], weight[:0], level[:0], linear[:0])]
+        modules_number = self.modules_number
+        while len(radius) > 0 and remaining > 0 and modules_number < MAX_MODULES:
+            remaining -= 1
+            if limit_method == "radius":
+                below = radius < min_radius
+                stopped.append((radius[below], weight[below], level[below], linear[below]))
+                radius, weight, level, linear = radius[~below], weight[~below], level[~below], linear[~below]
+            branch_level, transition = self.branch_levels(radius, level, linear)
+            modules.append((radius, weight * (1 - split_proba), np.where(transition, TRANSITION, BRANCH), branch_level))
+            modules.append((radius, weight * split_proba, np.full(len(radius), SPLIT), level))
+            modules_number += weight.sum()
+            # the head of a branch, then the two heads of a split
+            radius, weight, level, linear = merge(
+                np.concatenate((radius * radius_decrease, radius * radius_decrease, radius * split_radius)),
+                np.concatenate((weight * (1 - split_proba), weight * split_proba, weight * split_proba)),
+                np.concatenate((branch_level, level, level)),
+                np.concatenate((np.ones(len(radius), dtype=bool), np.zeros(2 * len(radius), dtype=bool))))
+        for module_radius, module_weight, kind, module_level in modules:
+            self.add_modules(module_radius, module_weight, kind, module_level, creator)
+        stopped.append((radius, weight, level, linear))
+        radius, weight, level, linear = [np.concatenate(arrays) for arrays in zip(*stopped)]
+        self.add_heads(radius, weight, level, linear, creator)
+
+    def geometry_size(self):
+        """Returns the expected number of vertices and faces of the final mesh"""
+        subdivision = 4 ** self.level
+        verts = self.weight * (BASE_VERTS[self.kind] + (subdivision - 1) * BASE_FACES[self.kind])
+        faces = self.weight * BASE_FACES[self.kind] * subdivision
+        # each free head is closed by a cap in the level of the module carrying it
+        caps = self.head_weight * 4 ** self.head_level
+        return int(verts.sum() + caps.sum() - self.head_weight.sum()), int(faces.sum() + caps.sum())
@@ -0,0 +1,156 @@
+# Math used to grow and build the modules, written with numpy only so that it can run outside of blender.
+# Every function accepts either single values or arrays of values, in which case it works on the whole batch.
+# Vectors are rows, and v * M in mathutils is written v @ M here.
+
+import numpy as np
+from math import pi
+from random import random
+
+
+Z_AXIS = np.array((0., 0., 1.))
+SQUARE = np.array(((-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0)), dtype=float)
+OCTAGON = np.array([(np.cos(pi*i/4), np.sin(pi*i/4), 0) for i in range(8)])
+
+
+def square(size):
+    """Returns the 4 corners of a square of specified size, shape (..., 4, 3)"""
+    return SQUARE * np.asarray(size, dtype=float)[..., None, None]
+
+
+def octagon(size):
+    """Returns the 8 corners of an octagon of specified size, shape (..., 8, 3)"""
+    return OCTAGON * np.asarray(size, dtype=float)[..., None, None]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=float)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def rotation_difference(a, b):
+    """Returns the (w, x, y, z) quaternions rotating a onto b, like mathutils Vector.rotation_difference"""
+    a, b = np.broadcast_arrays(normalize(a), normalize(b))
+    axis = np.cross(a, b)
+    axis_length = np.linalg.norm(axis, axis=-1)
+    dot = np.clip(np.sum(a * b, axis=-1), -1, 1)
+    # opposite vectors: any axis orthogonal to a works
+    ortho = np.cross(a, np.where(np.abs(a[..., :1]) < .9, (1., 0., 0.), (0., 1., 0.)))
+    opposite = (axis_length < 1e-6) & (dot < 0)
+    axis = np.where(opposite[..., None], ortho, axis)
+    angle = np.where(axis_length < 1e-6, np.where(dot < 0, pi, 0), np.arccos(dot))
+    axis = normalize(np.where((axis_length < 1e-6)[..., None] & ~opposite[..., None], Z_AXIS, axis))
+    return np.concatenate((np.cos(angle / 2)[..., None], axis * np.sin(angle / 2)[..., None]), axis=-1)
+
+
+def quaternion_to_matrix(q):
+    """Returns the (..., 3, 3) rotation matrices of (w, x, y, z) quaternions"""
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=float), -1, 0)
+    return np.stack((np.stack((1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)), axis=-1),
+                     np.stack((2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)), axis=-1),
+                     np.stack((2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)), axis=-1)), axis=-2)
+
+
+def rotation_matrix(angle, axis):
+    """Returns the (..., 3, 3) matrices of rotations around 'X', 'Y', 'Z' or an axis vector, like mathutils Matrix.Rotation"""
+    angle = np.asarray(angle, dtype=float)
+    c, s = np.cos(angle), np.sin(angle)
+    o, i = np.zeros_like(angle), np.ones_like(angle)
+    if not isinstance(axis, str):
+        x, y, z = np.moveaxis(normalize(axis), -1, 0)
+        t = 1 - c
+        rows = ((c + x*x*t, x*y*t - z*s, x*z*t + y*s),
+                (y*x*t + z*s, c + y*y*t, y*z*t - x*s),
+                (z*x*t - y*s, z*y*t + x*s, c + z*z*t))
+    elif axis == 'X':
+        rows = ((i, o, o), (o, c, -s), (o, s, c))
+    elif axis == 'Y':
+        rows = ((c, o, s), (o, i, o), (-s, o, c))
+    else:
+        rows = ((c, -s, o), (s, c, o), (o, o, i))
+    return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
+
+
+def orientation(direction, spin):
+    """Returns the matrices M such that v @ M spins v around z then aligns z with direction"""
+    direction_rotation = quaternion_to_matrix(rotation_difference(direction, Z_AXIS))
+    return rotation_matrix(spin, 'Z') @ direction_rotation
+
+
+def get_direction(primary_direction, angle, spin):
+    """Returns the direction deviating from primary_direction by angle, turned by spin"""
+    tilted = np.stack((np.sin(angle), np.zeros_like(angle), np.cos(angle)), axis=-1)
+    rot_2 = quaternion_to_matrix(rotation_difference(primary_direction, Z_AXIS))
+    return ((tilted[..., None, :] @ rotation_matrix(spin, 'Z')) @ rot_2)[..., 0, :]
+
+
+def directions_to_spin(direction, secondary_direction):
+    direction_rotation = quaternion_to_matrix(rotation_difference(Z_AXIS, direction))
+    secondary = (np.asarray(secondary_direction, dtype=float)[..., None, :] @ direction_rotation)[..., 0, :]
+    x, y = secondary[..., 0], secondary[..., 1]
+    # signed angle between (x, y) and (-1, 0)
+    return - np.arctan2(-y, -x)
+
+
+def random_vector(randomness=1, random=random):
+    """Returns a vector whose coordinates are uniformly picked in [-.5, .5] and scaled by randomness"""
+    return np.array((random() - .5, random() - .5, random() - .5)) * randomness
+
+
+def root_verts(position, direction, radius, spin):
+    return square(radius) @ orientation(direction, spin) + np.asarray(position)[..., None, :]
+
+
+def branch_verts(position, direction, base_radius, head_radius, length, spin):
+    """Returns the head ring of a branch"""
+    verts = square(head_radius) + np.stack((np.zeros_like(length), np.zeros_like(length), length), axis=-1)[..., None, :]
+    return verts @ orientation(direction, spin) + np.asarray(position)[..., None, :]
+
+
+def split_verts(position, direction, head_1_radius, head_2_radius, head_1_length, head_2_length,
+                primary_angle, secondary_angle, spin):
+    """Returns the two head rings of a split"""
+    offset_1 = np.stack((np.zeros_like(head_1_length), np.zeros_like(head_1_length), head_1_length), axis=-1)
+    offset_2 = np.stack((np.zeros_like(head_2_length), np.zeros_like(head_2_length), head_2_length), axis=-1)
+    v2 = (square(head_1_radius) + offset_1[..., None, :]) @ np.swapaxes(rotation_matrix(primary_angle, 'Y'), -1, -2)
+    v3 = (square(head_2_radius) + offset_2[..., None, :]) @ np.swapaxes(rotation_matrix(np.asarray(primary_angle) - secondary_angle, 'Y'), -1, -2)
+    verts = np.concatenate((v2, v3), axis=-2)
+    return verts @ orientation(direction, spin) + np.asarray(position)[..., None, :]
+
+
+def refine_ring(ring):
+    """Returns closed rings (..., n, 3) subdivided once with the cubic B-spline rule, shape (..., 2n, 3).
+    This is what Catmull-Clark subdivision does to an open boundary, so a ring refined here and then subdivided k times
+    matches exactly the original ring subdivided k + 1 times.
+    """
+    ring = np.asarray(ring, dtype=float)
+    following = np.roll(ring, -1, axis=-2)
+    moved = .75 * ring + (np.roll(ring, 1, axis=-2) + following) / 8
+    mids = (ring + following) / 2
+    return np.stack((moved, mids), axis=-2).reshape(ring.shape[:-2] + (2 * ring.shape[-2], 3))
+
+
+def transition_verts(position, direction, base_radius, head_radius, length, spin, base_ring=None):
+    """Returns the octagonal base, the square head and the 2 middle vertices of a transition.
+    The octagon is the base ring refined once, base_ring being the ring the transition is built on, rolled so that
+    its vertex k is below head vertex k. Without it a square of size base_radius is used.
+    """
+    frame = orientation(direction, spin)
+    position = np.asarray(position)[..., None, :]
+    head = square(head_radius) + np.stack((np.zeros_like(length), np.zeros_like(length), length), axis=-1)[..., None, :]
+    head = head @ frame + position
+    if base_ring is None:
+        base_ring = square(base_radius) @ frame + position
+    base = refine_ring(base_ring)
+    middle = (base[..., [2, 6], :] + head[..., [1, 3], :]) / 2
+    return np.concatenate((base, head, middle), axis=-2)
+
+
+def vertex_normals(verts, faces):
+    """Returns the unit normals of the vertices of a quad mesh, averaged from the faces around them weighted by area"""
+    corners = verts[faces]
+    # the cross product of the diagonals of a quad is twice its area along its normal
+    weighted = np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1])
+    normals = np.zeros(verts.shape)
+    np.add.at(normals, faces, weighted[:, None])
+    lengths = np.linalg.norm(normals, axis=-1, keepdims=True)
+    return normals / np.where(lengths > 0, lengths, 1)
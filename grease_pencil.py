@@ -4,7 +4,9 @@ import bpy
 from bpy.types import Operator
 from bpy.props import IntProperty, BoolProperty, FloatProperty
 
-from .modules import Root, Split, Branch, draw_module, directions_to_spin
+from .modules import draw_module
+from .skeleton import Root, Split, Branch, arena_tree
+from . import geometry
 
 from math import cos, inf, pi
 from random import random
@@ -137,6 +139,7 @@ def build_tree_from_strokes(strokes, radius, radius_dec):
     tree_dir = (strokes[0][1] - tree_pos).normalized()
     root = Root(position=tree_pos, direction=tree_dir, radius=radius, resolution=0)
     root.creator = "gp_trunk"
+    root = arena_tree(root)
     stroke = deque(strokes[0])
     build_tree_from_strokes_rec(stroke, root, 0, 0, 0, splits, strokes, radius_dec)
 
@@ -173,7 +176,7 @@ def build_tree_from_strokes_rec(points, module, head, curr_index, curr_stroke, s
                 child_direction = (child_points[0] - pos)
                 child_length = child_direction.length
                 child_direction.normalize()
-                spin = directions_to_spin(direction, child_direction)
+                spin = float(geometry.directions_to_spin(direction, child_direction))
                 choice = 'split'
                 break
         if choice == 'branch':
@@ -188,14 +191,10 @@ def build_tree_from_strokes_rec(points, module, head, curr_index, curr_stroke, s
                         points.popleft()
                 direction = points[0] - pos
             new_module.head_1_length = direction.length
-            new_module.head_2_direction = child_direction
             new_module.secondary_angle = direction.angle(child_direction)
 
-        if head == 0:
-            module.head_module_1 = new_module
-        else:
-            module.head_module_2 = new_module
         new_module.creator = "gp_trunk" if curr_stroke == 0 else "gp_branch"
+        new_module = module.attach(new_module, head)
         build_tree_from_strokes_rec(points, new_module, 0, curr_index+1, curr_stroke, splits, strokes, radius_dec)
         if choice == 'split':
             build_tree_from_strokes_rec(child_points, new_module, 1, 2, child_stroke, splits, strokes, radius_dec)
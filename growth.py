@@ -0,0 +1,141 @@
+# Growth of the skeleton of a tree: the trunk, the splits added along it and the branches grown from its free heads.
+# This file does not depend on blender. The modules grown at each iteration of grow are added to the arena at once,
+# their positions and directions being computed with numpy for the whole iteration.
+
+import numpy as np
+
+from math import pi, sqrt
+
+from . import geometry
+from .arena import BRANCH, SPLIT
+from .skeleton import Root, Split, Branch, arena_tree
+from .traversal import walk
+from .rng import Stream, child_uid
+
+
+def get_pruning_key(position, resolution=2):
+    result = []
+    for x in position:
+        result.append(int(x*resolution) / 2)
+    return tuple(result)
+
+
+def grow(root, iterations, min_radius, limit_method, branch_length, split_proba, split_angle, split_deviation,
+         split_radius, radius_decrease, randomness, spin, spin_randomness, creator, selection, gravity_strength,
+         pruning_strength, shape_factor, up_attraction, kill_below_0=True):
+    arena = root.arena
+    density_dict = arena.density_dict
+    root_position = arena.position[root.index].astype(float)
+    extremities = arena.extremities(arena.creator_mask(selection))
+    iteration = 0
+    if limit_method == "iterations":
+        condition = iteration < iterations
+    elif limit_method == "radius":
+        condition = True
+    else:
+        condition = False
+
+    while condition:
+        iteration += 1
+        modules = np.array([index for index, head in extremities], dtype=int)
+        heads = np.array([head for index, head in extremities], dtype=int)
+        positions = arena.position[modules].astype(float)
+        dist_from_axis = np.linalg.norm(positions[:, :2] - root_position[:2], axis=1).tolist()
+        up = arena.direction[modules, 2].astype(float).tolist()
+        radii = arena.head_radius[modules, heads].tolist()
+        uids = arena.uid[modules].tolist()
+
+        # the pruning of each head depends on the heads grown before it, the new modules are then made at once
+        grown, offsets, splits, spins = [], [], [], []
+        for i, head in enumerate(heads.tolist()):
+            key = get_pruning_key(positions[i])
+            if key not in density_dict:
+                density_dict[key] = 0.0
+            random = Stream(creator, child_uid(uids[i], head), 'grow').random
+            if random()*(pruning_strength*density_dict[key] + dist_from_axis[i]/30 * shape_factor - up[i]*up_attraction) < 1 \
+                    and (not kill_below_0 or positions[i, 2] >= 0):
+                if not (limit_method == "radius" and radii[i] < min_radius):
+                    grown.append(i)
+                    offsets.append(geometry.random_vector(randomness, random))
+                    is_split = random() < split_proba
+                    splits.append(is_split)
+                    spins.append(spin*pi/180 if is_split else (random()-.5) * spin_randomness)
+                    density_dict[key] += sqrt(radii[i])
+
+        extremities = []
+        if len(grown) > 0:
+            parents, parent_heads, splits = modules[grown], heads[grown], np.array(splits)
+            radius = arena.head_radius[parents, parent_heads].astype(float)
+            position, direction = arena.head_frames(parents, parent_heads)
+            direction = geometry.normalize(direction + np.array(offsets))
+            if gravity_strength != 0:
+                direction = geometry.normalize(direction + np.array((0, 0, -.1)) * gravity_strength)
+            new_modules = arena.extend(
+                parents, parent_heads, np.where(splits, SPLIT, BRANCH), creator, position=position,
+                direction=direction, radius=radius, spin=arena.spin[parents].astype(float) + spins,
+                head_radius=np.column_stack((radius_decrease * radius, np.where(splits, split_radius * radius, 0))),
+                head_length=np.column_stack((np.full(len(grown), branch_length), np.where(splits, radius * 3, 0))),
+                angle=np.where(splits[:, None], (split_deviation, split_angle*pi/180), 0))
+            for index, is_split in zip(new_modules.tolist(), splits.tolist()):
+                extremities.append((index, 0))
+                if is_split:
+                    extremities.append((index, 1))
+
+        if iteration > iterations and limit_method == 'iterations':
+            condition = False
+
+        if len(extremities) == 0:
+            condition = False
+
+
+def add_basic_trunk(radius, radius_decrease, randomness, up_attraction, twist, height, branch_length, horizontal=False):
+    direction = np.array((1., 0, 0)) if horizontal else np.array((0., 0, 1))
+    root = arena_tree(Root(position=np.zeros(3), direction=direction, radius=radius, resolution=0))
+    extremity = root
+    while np.linalg.norm(extremity.position) < height:
+        random = Stream('trunk', extremity.uid, 'trunk').random
+        direction = geometry.normalize(extremity.direction + geometry.random_vector(randomness, random) + direction * up_attraction)
+        new_module = Branch(extremity.get_head_pos(0), direction, extremity.head_1_radius, branch_length, radius_decrease, resolution=0, spin=extremity.spin + twist)
+        extremity = extremity.attach(new_module)
+    return root
+
+
+def add_splits(root, proba, selection, creator, split_angle, spin, head_size, offset, constraint_z=False):
+    # only modules that already exist are visited, so the selection can be computed once for the whole tree
+    selected = root.arena.selected(root.arena.creator_mask(selection))
+
+    def visit(module, state):
+        parent_module, head, curr_spin, curr_offset = state
+        is_selected = curr_offset <= 0 and selected[module.index]
+        random = Stream(creator, module.uid, 'split').random
+        if module.type == 'branch' and parent_module.head_module_1 is not None and random() < proba and is_selected:
+            curr_spin += spin
+            if constraint_z:
+                curr_spin = -90 + int(random() < .5) * 180
+            split = Split(module.position, module.direction, module.base_radius, module.resolution,
+                          module.starting_index, curr_spin, head_2_length=module.base_radius*2,
+                          head_2_radius=head_size)
+            split.primary_angle = 0
+            split.secondary_angle = split_angle*pi/180
+            split.head_1_length = module.base_radius
+            split.creator = creator
+            child = module.head_module_1
+            for i in range(int(split.head_2_radius / module.base_radius +.5)):
+                if child is not None and child.type == 'branch':
+                    child = child.head_module_1
+                else:
+                    break
+            if not root.arena.alive[parent_module.index]:
+                # after a split the walk goes on below the branch it replaced, which is out of the tree: the split is
+                # dropped instead of taking the rest of the branch out with it
+                return [(child, (module, 0, curr_spin, max(0, curr_offset-1)))]
+            split.head_module_1 = child
+            split = parent_module.attach(split, head)
+            return [(split.head_module_1, (module, 0, curr_spin, max(0, curr_offset-1)))]
+
+        children = [(module.head_module_1, (module, 0, curr_spin, max(0, curr_offset - 1)))]
+        if module.type == 'split':
+            children.append((module.head_module_2, (module, 1, curr_spin, offset)))
+        return children
+
+    walk(root.head_module_1, visit, (root, 0, root.spin, offset))
@@ -0,0 +1,94 @@
+# Bulk creation of mesh datablocks through numpy buffers, with the mesh API of blender 2.79.
+# The elements are added with add() and filled with foreach_set, which is much faster than creating them one by one
+# with bmesh and then assigning the uvs loop by loop. Per vertex values are written to int and float vertex layers the
+# same way.
+
+import numpy as np
+
+
+def write_mesh(mesh, verts, faces, uvs=None, uv_name="UVMap"):
+    """Fills an empty mesh with verts (n, 3), faces (m, k) holding the vertex indexes of polygons of k sides and
+    optionally uvs (m, k, 2). Invalid faces are removed by validation, as bmesh would have refused them.
+    """
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int32)
+    faces_number, sides = faces.shape
+
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set("co", verts.ravel())
+    mesh.loops.add(faces.size)
+    mesh.loops.foreach_set("vertex_index", faces.ravel())
+    mesh.polygons.add(faces_number)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, faces.size, sides, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(faces_number, sides, dtype=np.int32))
+
+    if uvs is not None:
+        # uv layers are created along with their uv texture
+        mesh.uv_textures.new(uv_name)
+        mesh.uv_layers[uv_name].data.foreach_set("uv", np.asarray(uvs, dtype=np.float32).ravel())
+
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    return mesh
+
+
+def write_edges(mesh, verts, edges):
+    """Fills an empty mesh with verts (n, 3) and edges (m, 2) holding vertex indexes, without any face"""
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+    edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set("co", verts.ravel())
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set("vertices", edges.ravel())
+    mesh.update()
+    mesh.validate()
+    return mesh
+
+
+def clear_mesh(mesh):
+    """Removes the geometry and the layers of a mesh in place, keeping its materials and the objects using it"""
+    # bmesh is only imported here, so that the writers can be imported without blender
+    import bmesh
+    bm = bmesh.new()
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+
+def set_custom_normals(mesh, normals):
+    """Shades the mesh smooth with the given vertex normals (n, 3) as custom split normals"""
+    smooth = np.ones(len(mesh.polygons), dtype=bool)
+    mesh.polygons.foreach_set("use_smooth", smooth)
+    mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set_from_vertices(np.asarray(normals, dtype=np.float32))
+
+
+def write_attribute(mesh, name, values):
+    """Stores one value per vertex in a new int or float layer of the mesh, depending on the dtype of values"""
+    values = np.asarray(values)
+    is_int = np.issubdtype(values.dtype, np.integer)
+    if is_int:
+        layer = mesh.vertex_layers_int.new(name)
+    else:
+        layer = mesh.vertex_layers_float.new(name)
+    layer.data.foreach_set("value", values.astype(np.int32 if is_int else np.float32).ravel())
+    return layer
+
+
+def write_vertex_group(obj, name, weights, indexes=None, precision=1/1024):
+    """Fills the vertex group name, created if needed, with weights for the vertices indexes, all by default.
+
+    Vertex groups have no bulk setter, so the weights are rounded to precision and the vertices sharing a weight are
+    added in one call.
+    """
+    group = obj.vertex_groups.get(name)
+    if group is None:
+        group = obj.vertex_groups.new(name)
+    weights = np.asarray(weights, dtype=float).ravel()
+    indexes = np.arange(len(weights)) if indexes is None else np.asarray(indexes).ravel()
+    steps, inverse = np.unique(np.round(weights / precision).astype(np.int64), return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(steps)))[:-1]
+    for step, batch in zip(steps.tolist(), np.split(indexes[order], bounds)):
+        group.add(batch.tolist(), step * precision, 'REPLACE')
+    return group
@@ -14,8 +14,16 @@ import random
 from math import pi, inf
 
 from .grease_pencil import build_tree_from_strokes
-from .tree_functions import draw_module, add_splits, grow, add_basic_trunk, add_armature, add_particles_emitter
-from .modules import visualize_with_curves
+from .growth import add_splits, grow, add_basic_trunk
+from .tree_functions import add_armature, add_particles_emitter
+from .modules import draw_module, visualize_with_curves, visualize_with_edges
+from .skeleton import save_tree, load_tree
+from .estimate import Forecast
+from . import rng, datablocks
+
+
+# forecasts of the trees of the BuildTree nodes, by tree parameters, so that drawing the nodes does not recompute them
+forecasts = {}
 
 
 def get_tree_parameters_rec(state_list, node, props_dict):
@@ -26,7 +34,9 @@ def get_tree_parameters_rec(state_list, node, props_dict):
                                   "up_attraction", "iterations", "radius"],
                      "TrunkNode": ["radius", "height", "branch_length", "radius_decrease", "randomness", "up_attraction", "twist"],
                      "GreasePencilNode": ["smooth_iterations", "radius", "radius_decrease", "branch_length"],
-                     "BuildTreeNode": ["mesh_type", "resolution_levels", "seed", "auto_update", "scale", "armature", "min_armature_radius", "min_length", "create_particle_emitter",
+                     "SkeletonNode": ["filepath"],
+                     "BuildTreeNode": ["mesh_type", "resolution_levels", "seed", "auto_update", "preview_budget", "preview_min_radius", "preview_angle",
+                                   "custom_normals", "scale", "armature", "min_armature_radius", "min_length", "create_particle_emitter",
                                    "dupli_object", "max_radius", "particle_proba", "material"]}
     for prop in props_dict[node.bl_idname]:
         value = getattr(node, prop)
@@ -39,7 +49,7 @@ def get_tree_parameters_rec(state_list, node, props_dict):
     # else:
     #     state_list += "{};{};{};{};{};{};" str(node.seed) + str(node.mesh_type) + str(node.armature) + str(node.min_length) + ","
 
-    if node.bl_idname == "GreasePencilNode" or node.bl_idname == "TrunkNode":
+    if node.bl_idname in {"GreasePencilNode", "TrunkNode", "SkeletonNode"}:
         return state_list
 
     try:
@@ -69,13 +79,13 @@ def get_change_level(new, old):
 
     for i in range(len(new)):
         if new[i] != old[i]:
-            if i < 4:
+            if i < 8:
                 return "gen"
-            elif i == 4:
+            elif i == 8:
                 return "scale"
-            elif i < 8:
-                return "armature"
             elif i < 12:
+                return "armature"
+            elif i < 16:
                 return "emitter"
             else:
                 return "material"
@@ -149,10 +159,15 @@ class BuildTreeNode(Node, ModularTreeNode):
     memory = StringProperty(default="")
 
     mesh_type = bpy.props.EnumProperty(
-        items=[('final', 'Final', ''), ('preview', 'Preview', '')],
+        items=[('final', 'Final', ''), ('preview', 'Preview', ''), ('edges', 'Edges', 'Preview the tree with a mesh of edges, cheaper to draw than curves on very large trees')],
         name="visualisation",
         default="preview")
     resolution_levels = IntProperty(min=0, default=1)
+    preview_budget = IntProperty(min=0, default=20000, description="Maximum number of modules shown in the preview, 0 shows them all")
+    preview_min_radius = FloatProperty(min=0, default=0, description="Branches thinner than this are hidden in the preview")
+    preview_angle = FloatProperty(min=0, max=90, default=2, description="Points where a branch turns by less than this angle are skipped in the preview")
+    chunk_size = IntProperty(min=0, default=0, description="Number of faces subdivided at once, 0 subdivides each resolution level at once. Lower values use less memory on big trees")
+    custom_normals = BoolProperty(default=False, description="Shade the final mesh smooth with vertex normals averaged from the faces around them")
     seed = IntProperty(default=42)
     auto_update = BoolProperty(default=False)
 
@@ -167,6 +182,13 @@ class BuildTreeNode(Node, ModularTreeNode):
     max_radius = FloatProperty(default=.2, min=0)
     particle_proba = FloatProperty(default=.5, min=0, max=1)
     material = StringProperty(default="")
+    tree_object = StringProperty(default="", description="Object overwritten each time the tree is built")
+    armature_object = StringProperty(default="", description="Armature overwritten each time the tree is built")
+    emitter_object = StringProperty(default="", description="Leaves emitter overwritten each time the tree is built")
+    skeleton_path = StringProperty(default="", subtype='FILE_PATH', description="File where the skeleton is saved each time the tree is grown")
+    module_budget = IntProperty(min=0, default=100000, description="Maximum estimated number of modules a build can grow, 0 disables the check")
+    face_budget = IntProperty(min=0, default=2000000, description="Maximum estimated number of faces of a final mesh, 0 disables the check")
+    refuse_over_budget = BoolProperty(default=False, description="Refuse the builds estimated over budget instead of warning about them")
 
     def init(self, context):
 
@@ -177,6 +199,16 @@ class BuildTreeNode(Node, ModularTreeNode):
         layout.prop(self, "mesh_type")
         if self.mesh_type == "final":
             layout.prop(self, "resolution_levels")
+            layout.prop(self, "chunk_size")
+            layout.prop(self, "custom_normals")
+        else:
+            layout.prop(self, "preview_budget")
+            layout.prop(self, "preview_min_radius")
+            if self.mesh_type == "preview":
+                layout.prop(self, "preview_angle")
+            tree_object = context.scene.objects.get(self.tree_object)
+            if tree_object is not None and tree_object.get("preview_generated") is not None:
+                layout.label("modules shown: {} / {}".format(tree_object["preview_shown"], tree_object["preview_generated"]))
         layout.prop(self, "seed")
         layout.prop(self, "scale")
         box = layout.row()
@@ -202,9 +234,68 @@ class BuildTreeNode(Node, ModularTreeNode):
             layout.prop_search(self, "dupli_object", context.scene, "objects")
 
         layout.prop_search(self, "material", bpy.data, "materials")
+        layout.prop(self, "skeleton_path")
+
+        box = layout.box()
+        forecast = self.forecast()
+        if forecast is None:
+            box.label("estimate: unknown before growth")
+        elif self.mesh_type == "final":
+            verts, faces = forecast.geometry_size()
+            box.label("estimate: {} modules, {} verts, {} faces".format(int(forecast.modules_number), verts, faces))
+        else:
+            box.label("estimate: {} modules".format(int(forecast.modules_number)))
+        box.prop(self, "module_budget")
+        if self.mesh_type == "final":
+            box.prop(self, "face_budget")
+        box.prop(self, "refuse_over_budget")
+        message = self.budget_message()
+        if message is not None:
+            box.label(message, icon='ERROR')
+
+    def estimate(self):
+        try:
+            from_node = self.inputs['Tree'].links[0].from_node
+        except:
+            return None
+        return from_node.estimate(self.resolution_levels)
+
+    def forecast(self):
+        """Returns the estimated size of the tree built by the node, or None when it is unknown before growth"""
+        key = get_tree_parameters_rec("", self, None)
+        if key not in forecasts:
+            if len(forecasts) > 16:
+                forecasts.clear()
+            forecasts[key] = self.estimate()
+        return forecasts[key]
+
+    def budget_message(self):
+        """Returns why the build is estimated over budget, or None when it is not"""
+        forecast = self.forecast()
+        if forecast is None:
+            return None
+        if 0 < self.module_budget < forecast.modules_number:
+            return "estimate of {} modules over the budget of {}".format(int(forecast.modules_number), self.module_budget)
+        if self.mesh_type == "final" and self.face_budget > 0:
+            faces = forecast.geometry_size()[1]
+            if faces > self.face_budget:
+                return "estimate of {} faces over the budget of {}".format(faces, self.face_budget)
+        return None
+
+    def check_budget(self, operator):
+        """Reports through operator when the build is estimated over budget. Returns False when the build is refused"""
+        message = self.budget_message()
+        if message is None:
+            return True
+        if self.refuse_over_budget:
+            operator.report({'ERROR'}, message + ", build refused")
+            return False
+        operator.report({'WARNING'}, message)
+        return True
 
     def execute(self, level="gen", old_tree=None):
         random.seed(self.seed)
+        rng.seed(self.seed)
         try:
             from_node = self.inputs['Tree'].links[0].from_node
         except:
@@ -212,41 +303,69 @@ class BuildTreeNode(Node, ModularTreeNode):
         t0 = time.time()
         t1 = time.time()
         rebuild = level == "gen"
+        # the objects of the previous build are overwritten in place
+        tree_object = bpy.context.scene.objects.get(self.tree_object)
         if rebuild:
             tree = from_node.execute()
             if tree is None:
                 return None
             t1 = time.time()
+            if self.skeleton_path != "":
+                save_tree(tree, bpy.path.abspath(self.skeleton_path))
             if self.mesh_type == "final":
-                draw_module(tree, self.resolution_levels)
+                tree_object = draw_module(tree, self.resolution_levels, custom_normals=self.custom_normals,
+                                          chunk_size=self.chunk_size, obj=tree_object)
+            elif self.mesh_type == "edges":
+                tree_object = visualize_with_edges(tree, obj=tree_object, budget=self.preview_budget,
+                                                   min_radius=self.preview_min_radius)
             else:
-                visualize_with_curves(tree)
+                tree_object = visualize_with_curves(tree, obj=tree_object, budget=self.preview_budget,
+                                                    min_radius=self.preview_min_radius, max_angle=self.preview_angle)
+            self.tree_object = tree_object.name
+            datablocks.own(self, tree_object, tree_object.data)
         else:
             tree = old_tree
+            if tree_object is None:
+                tree_object = bpy.context.object
 
-        tree_object = bpy.context.object
         if level in ("gen", "scale"):
             tree_object.scale = tuple([self.scale]*3)
 
-        if self.armature and level in ("armature", "gen"):
-            amt = add_armature(tree, self.min_armature_radius, self.min_length)
-            tree_object["amt"] = amt.name
-            # amt.select = True
-            amt.scale = tuple([self.scale] * 3)
-
-        if self.create_particle_emitter and level in ("emitter", "gen"):
-            emitter = add_particles_emitter(tree, self.max_radius, self.particle_proba, bpy.context.scene.objects.get(self.dupli_object))
-            tree_object["emitter"] = emitter.name
-            # emitter.select = True
-            emitter.scale = tuple([self.scale] * 3)
+        if level in ("armature", "gen"):
+            # the armature and the emitter are kept by the node, the tree object can be replaced by another type
+            amt = bpy.context.scene.objects.get(self.armature_object)
+            if self.armature:
+                amt = add_armature(tree, self.min_armature_radius, self.min_length, rig=amt)
+                self.armature_object = amt.name
+                datablocks.own(self, amt, amt.data)
+                # amt.select = True
+                amt.scale = tuple([self.scale] * 3)
+            elif amt is not None:
+                bpy.data.objects.remove(amt, do_unlink=True)
+                self.armature_object = ""
+
+        if level in ("emitter", "gen"):
+            emitter = bpy.context.scene.objects.get(self.emitter_object)
+            if self.create_particle_emitter:
+                emitter = add_particles_emitter(tree, self.max_radius, self.particle_proba, bpy.context.scene.objects.get(self.dupli_object), obj=emitter)
+                self.emitter_object = emitter.name
+                datablocks.own(self, emitter, emitter.data, *[system.settings for system in emitter.particle_systems])
+                # emitter.select = True
+                emitter.scale = tuple([self.scale] * 3)
+            elif emitter is not None:
+                bpy.data.objects.remove(emitter, do_unlink=True)
+                self.emitter_object = ""
 
         if bpy.data.materials.get(self.material) is not None and level in ("material", "gen"):
             tree_object.active_material = bpy.data.materials.get(self.material)
 
 
+        # what the previous build used and this one does not is released
+        reclaimed, reclaimed_size = datablocks.reclaim(self)
         t2 = time.time()
         print("creating tree", t1 - t0)
         print("building object", t2 - t1)
+        print("released datablocks", reclaimed, "bytes", reclaimed_size)
         return tree
 
 
@@ -293,6 +412,10 @@ class GreasePencilNode(Node, ModularTreeNode):
             root = build_tree_from_strokes(strokes, self.radius, self.radius_decrease)
             return root
 
+    def estimate(self, resolution_levels):
+        # the size of the tree depends on the strokes
+        return None
+
 
 class SplitNode(Node, ModularTreeNode):
     bl_idname = "SplitNode"
@@ -333,6 +456,19 @@ class SplitNode(Node, ModularTreeNode):
         add_splits(tree, self.proba, selection, self.selection[0], self.split_angle, self.spin/180*pi, self.head_size, self.offset)
         return tree
 
+    def estimate(self, resolution_levels):
+        try:
+            from_node = self.inputs['Tree'].links[0].from_node
+        except:
+            return None
+        forecast = from_node.estimate(resolution_levels)
+        if forecast is None:
+            return None
+
+        selection = self.inputs["Selection"].get_selection()
+        forecast.add_splits(self.proba, selection, self.selection[0], self.head_size)
+        return forecast
+
 
 class GrowNode(Node, ModularTreeNode):
     bl_idname = "GrowNode"
@@ -417,6 +553,20 @@ class GrowNode(Node, ModularTreeNode):
              self.shape_factor, self.up_attraction)
         return tree
 
+    def estimate(self, resolution_levels):
+        try:
+            from_node = self.inputs['Tree'].links[0].from_node
+        except:
+            return None
+        forecast = from_node.estimate(resolution_levels)
+        if forecast is None:
+            return None
+
+        selection = self.inputs["Selection"].get_selection()
+        forecast.grow(self.iterations, self.radius, self.limit_method, self.split_proba, self.split_radius,
+                      self.radius_decrease, self.selection[0], selection)
+        return forecast
+
 
 class TrunkNode(Node, ModularTreeNode):
     bl_idname = "TrunkNode"
@@ -449,6 +599,39 @@ class TrunkNode(Node, ModularTreeNode):
         tree = add_basic_trunk(self.radius, self.radius_decrease, self.randomness, self.up_attraction, self.twist, self.height, self.branch_length)
         return tree
 
+    def estimate(self, resolution_levels):
+        forecast = Forecast(resolution_levels)
+        forecast.add_basic_trunk(self.radius, self.radius_decrease, self.height, self.branch_length)
+        return forecast
+
+
+class SkeletonNode(Node, ModularTreeNode):
+    bl_idname = "SkeletonNode"
+    bl_label = "Skeleton"
+
+    filepath = StringProperty(default="", subtype='FILE_PATH', description="Skeleton file saved by a BuildTree node")
+
+    def init(self, context):
+        self.outputs.new("TreeSocketType", "Tree")
+
+    def draw_buttons(self, context, layout):
+        layout.prop(self, "filepath")
+
+    def execute(self):
+        filepath = bpy.path.abspath(self.filepath)
+        if not os.path.isfile(filepath):
+            return None
+        try:
+            return load_tree(filepath)
+        except ValueError as error:
+            # an invalid skeleton makes an invalid node tree
+            print(error)
+            return None
+
+    def estimate(self, resolution_levels):
+        # the size of the tree is in the file
+        return None
+
 
 class ModularTreeNodeCategory(NodeCategory):
     @classmethod
@@ -456,7 +639,7 @@ class ModularTreeNodeCategory(NodeCategory):
         return context.space_data.tree_type == 'ModularTreeType'
 
 
-inputs = [GreasePencilNode, TrunkNode]
+inputs = [GreasePencilNode, TrunkNode, SkeletonNode]
 tree_functions = [SplitNode, GrowNode]
 outputs = [BuildTreeNode]
 
@@ -464,7 +647,7 @@ node_categories = [ModularTreeNodeCategory("inputs", "inputs", items=[NodeItem(i
                    ModularTreeNodeCategory("tree_functions", "tree functions", items=[NodeItem(i.bl_idname) for i in tree_functions]),
                    ModularTreeNodeCategory("outputs", "outputs", items=[NodeItem(i.bl_idname) for i in outputs])]
 
-node_classes_to_register = [ModularTree, TreeSocket, BuildTreeNode, GreasePencilNode, SplitNode, GrowNode, TrunkNode]
+node_classes_to_register = [ModularTree, TreeSocket, BuildTreeNode, GreasePencilNode, SplitNode, GrowNode, TrunkNode, SkeletonNode]
 
 
 # @persistent
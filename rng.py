@@ -0,0 +1,56 @@
+# Counter based random streams.
+# Each random draw is a hash of (seed, node, module id, purpose, counter), so the randomness used for a module does
+# not depend on the order in which the tree is evaluated, on the process doing it or on the other modules.
+# Module ids are derived from the id of the parent module and the head the module is attached to.
+
+from zlib import crc32
+
+
+MASK = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+_seed = 0
+
+
+def splitmix64(x):
+    x = (x + GOLDEN_GAMMA) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+def to_key(value):
+    if isinstance(value, str):
+        return crc32(value.encode())
+    return int(value) & MASK
+
+
+def mix(*values):
+    """Hashes a sequence of strings and integers to a 64 bits integer"""
+    h = 0
+    for value in values:
+        h = splitmix64(h ^ to_key(value))
+    return h
+
+
+def child_uid(parent_uid, head):
+    """Returns the id of the module attached to the specified head of the module parent_uid"""
+    return mix(parent_uid, head)
+
+
+def seed(value):
+    """Sets the seed of all streams, like random.seed"""
+    global _seed
+    _seed = to_key(value)
+
+
+class Stream:
+    """Random numbers reserved for one purpose of one module, created by one node"""
+    def __init__(self, node, uid, purpose):
+        self.key = mix(_seed, node, uid, purpose)
+        self.counter = 0
+
+    def random(self):
+        """Returns the next float of the stream in [0, 1)"""
+        self.counter += 1
+        return (splitmix64(self.key ^ self.counter) >> 11) * (1.0 / (1 << 53))
@@ -0,0 +1,224 @@
+# The objective is to build a tree object whose all branches are connected. In other words, the tree is manifold.
+# To do so, the tree is generated as a succession of modules that can represent splits, stems and so on.
+# The modules are objects from the class Module, stored in a TreeArena and read back through ArenaModule views.
+# Each module has a resolution, except the modules that make the junction between two different levels of subdivision.
+# This file does not depend on blender, vectors are numpy arrays.
+
+import numpy as np
+from math import pi
+
+from .rng import child_uid
+from .arena import TreeArena, TYPE_NAMES, SPLIT, load as arena_load
+
+
+class Module:
+    def __init__(self, position, direction, radius, resolution, starting_index, spin):
+        self.uv_height = 0
+        self.type = 'module'
+        self.creator = "default"
+        self.uid = 0
+        self.position = position
+        self.direction = direction
+        self.base_radius = radius
+        self.resolution = resolution
+        self.spin = spin
+        self.starting_index = starting_index
+        self.head_module_1 = None
+        self.head_module_2 = None
+
+    def attach(self, module, head=0):
+        """Links module to the specified head and returns it. The module gets the id matching this position"""
+        module.uid = child_uid(self.uid, head)
+        if head == 0:
+            self.head_module_1 = module
+        else:
+            self.head_module_2 = module
+        return module
+
+    def __repr__(self):
+        position = str(tuple(np.round(np.asarray(self.position, dtype=float), 2).tolist()))
+        if self.type == 'split':
+            return str(self.type) + " " + position + " " + self.head_module_1.__repr__() + self.head_module_2.__repr__()
+        else:
+            return str(self.type) + " " + position + " " + self.head_module_1.__repr__()
+
+
+class Split(Module):
+    def __init__(self, position=(0, 0, 0), direction=(0, 0, 1), radius=1, resolution=0, starting_index=0, spin=0, head_2_length=1, head_2_radius=.6):
+        Module.__init__(self,position, direction, radius, resolution, starting_index, spin)
+        self.type = 'split'
+        self.head_1_radius = .99 * self.base_radius
+        self.head_2_radius = head_2_radius * self.base_radius
+        self.primary_angle = pi/18
+        self.secondary_angle = pi/4
+        self.head_1_length = self.base_radius * 3
+        self.head_2_length = head_2_length
+        self.head_number = 2
+
+
+class Branch(Module):
+    def __init__(self, position=(0, 0, 0), direction=(0, 0, 1), radius=1, length=1, head_radius=.95, resolution=0,
+                 starting_index=0, spin=0):
+        Module.__init__(self, position, direction, radius, resolution, starting_index, spin)
+        self.type = "branch"
+        self.length = length
+        self.head_1_radius = head_radius * self.base_radius
+        self.head_number = 1
+        self.draw_base = False
+
+
+class Root(Module):
+    def __init__(self, position=(0, 0, 0), direction=(0, 0, 1), radius=1, resolution=0, starting_index=0, spin=0):
+        Module.__init__(self, position, direction, radius, resolution, starting_index, spin)
+        self.type = "root"
+        self.head_number = 1
+        self.head_1_radius = self.base_radius
+        self.density_dict = dict()
+
+
+class Transition(Module):
+    def __init__(self, position=(0, 0, 0), direction=(0, 0, 1), radius=1, length=1, head_radius=.95, resolution=0, starting_index=0, spin=0 ):
+        Module.__init__(self, position, direction, radius, resolution, starting_index, spin)
+        self.type = "transition"
+        self.head_1_radius = head_radius
+        self.length = length
+        self.head_number = 1
+
+
+def arena_field(name, column=None):
+    """Returns a property reading and writing one scalar field of a TreeArena row"""
+    def getter(self):
+        array = getattr(self.arena, name)
+        return (array[self.index] if column is None else array[self.index, column]).item()
+
+    def setter(self, value):
+        array = getattr(self.arena, name)
+        if column is None:
+            array[self.index] = value
+        else:
+            array[self.index, column] = value
+    return property(getter, setter)
+
+
+def arena_vector(name):
+    """Returns a property reading and writing one vector field of a TreeArena row"""
+    def getter(self):
+        return getattr(self.arena, name)[self.index].astype(float)
+
+    def setter(self, value):
+        getattr(self.arena, name)[self.index] = tuple(value)
+    return property(getter, setter)
+
+
+def arena_head(head):
+    def getter(self):
+        index = self.arena.head[self.index, head]
+        return None if index < 0 else module_view(self.arena, index)
+
+    def setter(self, module):
+        if module is None:
+            self.arena.detach(self.index, head)
+        else:
+            self.arena.add(module, self.index, head)
+    return property(getter, setter)
+
+
+class ArenaModule:
+    """Module compatible view of a row of a TreeArena. Views are cheap and are created on demand."""
+    position = arena_vector("position")
+    direction = arena_vector("direction")
+    base_radius = arena_field("radius")
+    head_1_radius = arena_field("head_radius", 0)
+    head_2_radius = arena_field("head_radius", 1)
+    length = arena_field("head_length", 0)
+    head_1_length = arena_field("head_length", 0)
+    head_2_length = arena_field("head_length", 1)
+    primary_angle = arena_field("angle", 0)
+    secondary_angle = arena_field("angle", 1)
+    spin = arena_field("spin")
+    resolution = arena_field("resolution")
+    draw_base = arena_field("draw_base")
+    starting_index = arena_field("starting_index")
+    uv_height = arena_field("uv_height")
+    uid = arena_field("uid")
+    head_module_1 = arena_head(0)
+    head_module_2 = arena_head(1)
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, ArenaModule) and other.arena is self.arena and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    @property
+    def type(self):
+        return TYPE_NAMES[self.arena.type[self.index]]
+
+    @property
+    def head_number(self):
+        return 2 if self.arena.type[self.index] == SPLIT else 1
+
+    @property
+    def creator(self):
+        return self.arena.creators[self.arena.creator[self.index]]
+
+    @creator.setter
+    def creator(self, creator):
+        self.arena.set_creator(self.index, creator)
+
+    @property
+    def density_dict(self):
+        return self.arena.density_dict
+
+    def get_head_pos(self, head):
+        return self.arena.head_frames([self.index], [head])[0][0]
+
+    def attach(self, module, head=0):
+        module.uid = child_uid(self.uid, head)
+        return module_view(self.arena, self.arena.add(module, self.index, head))
+
+
+class ArenaRoot(ArenaModule, Root):
+    pass
+
+
+class ArenaBranch(ArenaModule, Branch):
+    pass
+
+
+class ArenaSplit(ArenaModule, Split):
+    pass
+
+
+class ArenaTransition(ArenaModule, Transition):
+    pass
+
+
+view_classes = (ArenaRoot, ArenaBranch, ArenaSplit, ArenaTransition)
+
+
+def module_view(arena, index):
+    return view_classes[arena.type[index]](arena, index)
+
+
+def arena_tree(root):
+    """Stores a module graph in a new TreeArena and returns the view of its root"""
+    arena = TreeArena()
+    return module_view(arena, arena.add(root))
+
+
+def save_tree(root, filepath):
+    """Writes the module graph of root to a skeleton file"""
+    if not isinstance(root, ArenaModule):
+        root = arena_tree(root)
+    root.arena.save(filepath, root.index)
+
+
+def load_tree(filepath):
+    """Returns the view of the root of a skeleton file, whose fields are memory mapped"""
+    arena, root = arena_load(filepath)
+    return module_view(arena, root)
@@ -0,0 +1,139 @@
+# Streaming assembly of the final mesh of a tree.
+# The geometry of each resolution level is split in islands, sets of connected faces, that can be subdivided on their
+# own since Catmull-Clark only looks at neighbouring faces. Islands are grouped in chunks that are yielded one after
+# the other, the levels with the most subdivisions first so that the parent of a transition is always in a previous
+# chunk. Only the indexes of the head rings waiting for their transitions are kept from one chunk to the next.
+# A sink consumes each chunk before the next one is built, so the subdivided geometry is never held at once.
+
+import numpy as np
+
+from . import subdivision
+from .mesh_writer import write_mesh
+
+
+def islands(faces, verts_number):
+    """Returns the label of the island of each face"""
+    edges = np.stack((faces[:, :-1], faces[:, 1:]), axis=2).reshape(-1, 2)
+    return subdivision.label_components(edges, verts_number)[faces[:, 0]]
+
+
+def batches(face_islands, level, chunk_size):
+    """Groups the faces of a level by islands in batches of at least chunk_size faces once subdivided, or in one
+    batch when chunk_size is 0. Yields the boolean selection of the faces of each batch.
+    """
+    if chunk_size <= 0:
+        yield np.ones(len(face_islands), dtype=bool)
+        return
+    labels, sizes = np.unique(face_islands, return_counts=True)
+    sizes = sizes * 4 ** level
+    first = 0
+    total = 0
+    for i, size in enumerate(sizes.tolist()):
+        total += size
+        if total >= chunk_size or i == len(sizes) - 1:
+            yield np.isin(face_islands, labels[first:i+1])
+            first = i + 1
+            total = 0
+
+
+def chunks(verts, faces, uvs, weights, owners, welds=(), chunk_size=0):
+    """Yields the subdivided geometry of the tree chunk by chunk.
+
+    verts, faces, uvs, weights and owners (the module of each face) hold the geometry of each resolution level before
+    subdivision, and welds the (parent levels, parent rings, levels, octagons) arrays of the transitions.
+    Each chunk is (verts, faces, uvs, weights, owners) where verts, weights and owners (the module of each vertex)
+    only hold the new vertices, appended after the vertices of the previous chunks, and faces index all of them.
+    chunk_size is the number of subdivided faces a chunk should reach, 0 making one chunk per level.
+    """
+    welds = list(welds)
+    if len(welds) > 0:
+        parent_levels, rings, levels, octagons = [np.concatenate(arrays) for arrays in zip(*welds)]
+    else:
+        parent_levels, levels = np.zeros((2, 0), dtype=int)
+        rings, octagons = np.zeros((0, 4), dtype=int), np.zeros((0, 8), dtype=int)
+    pending = dict()  # transition: global indexes of the subdivided head ring it is welded to
+    offset = 0
+
+    for level in reversed(range(len(verts))):
+        level_faces = faces[level]
+        if len(level_faces) == 0:
+            continue
+        face_islands = islands(level_faces, len(verts[level]))
+        level_rings = np.flatnonzero(parent_levels == level)
+        level_octagons = np.flatnonzero(levels == level)
+        for selection in batches(face_islands, level, chunk_size):
+            used = np.zeros(len(verts[level]), dtype=bool)
+            used[level_faces[selection]] = True
+            local = np.cumsum(used) - 1
+            kept_rings = level_rings[used[rings[level_rings, 0]]]
+            removed_octagons = level_octagons[used[octagons[level_octagons, 0]]]
+
+            data = np.column_stack((verts[level][used], weights[level][used]))
+            loops = [local[rings[kept_rings]], local[octagons[removed_octagons]]]
+            data, chunk_faces, chunk_uvs, (ring_loops, octagon_loops) = subdivision.subdivide(
+                data, local[level_faces[selection]], uvs[level][selection], level, loops)
+            chunk_owners = np.repeat(owners[level][selection], 4 ** level)
+
+            # the vertices of the octagons are replaced by the head rings of their parents, in previous chunks
+            keep = np.ones(len(data), dtype=bool)
+            keep[octagon_loops.ravel()] = False
+            indexes = offset + np.cumsum(keep) - 1
+            if len(removed_octagons) > 0:
+                indexes[octagon_loops.ravel()] = np.concatenate([pending.pop(t) for t in removed_octagons.tolist()])
+            for t, loop in zip(kept_rings.tolist(), ring_loops):
+                pending[t] = indexes[loop]
+
+            verts_owners = np.zeros(len(data), dtype=np.int32)
+            verts_owners[chunk_faces.ravel()] = np.repeat(chunk_owners, 4)
+            offset += int(keep.sum())
+            yield data[keep, :3], indexes[chunk_faces], chunk_uvs, data[keep, 3], verts_owners[keep]
+
+
+def assemble(chunks, sink):
+    """Feeds the chunks to the sink one by one and returns what the sink returns once closed"""
+    for chunk in chunks:
+        sink.write(*chunk)
+    return sink.close()
+
+
+class MeshSink:
+    """Keeps the chunks in compact arrays and fills a mesh datablock with them when closed.
+
+    A mesh is filled with one foreach_set per attribute, so the final geometry is held once, but the subdivision
+    buffers only for one chunk.
+    """
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.parts = []
+
+    def write(self, verts, faces, uvs, weights, owners):
+        self.parts.append((verts.astype(np.float32), faces.astype(np.int32), uvs.astype(np.float32),
+                           weights.astype(np.float32), owners.astype(np.int32)))
+
+    def close(self):
+        """Fills the mesh and returns the verts, faces, weights and vertex owners of the whole tree"""
+        if len(self.parts) == 0:
+            # a tree without any face, like a lone root, gives an empty mesh
+            self.write(np.zeros((0, 3)), np.zeros((0, 4)), np.zeros((0, 4, 2)), np.zeros(0), np.zeros(0))
+        verts, faces, uvs, weights, owners = [np.concatenate(arrays) for arrays in zip(*self.parts)]
+        self.parts = []
+        write_mesh(self.mesh, verts, faces, uvs)
+        return verts, faces, weights, owners
+
+
+class ObjSink:
+    """Writes the chunks to a wavefront obj file as they come, only the current chunk being in memory"""
+    def __init__(self, filepath):
+        self.file = open(filepath, 'w')
+        self.file.write("# modular tree\n")
+        self.uvs_count = 0
+
+    def write(self, verts, faces, uvs, weights, owners):
+        np.savetxt(self.file, verts, fmt="v %.6f %.6f %.6f")
+        np.savetxt(self.file, uvs.reshape(-1, 2), fmt="vt %.6f %.6f")
+        corners = np.stack((faces + 1, self.uvs_count + 1 + np.arange(faces.size).reshape(faces.shape)), axis=2)
+        np.savetxt(self.file, corners.reshape(len(faces), -1), fmt="f" + " %d/%d" * faces.shape[1])
+        self.uvs_count += faces.size
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,116 @@
+# Catmull-Clark subdivision of quad meshes with numpy.
+# Each step turns V vertices, E edges and F faces into V + E + F vertices laid out as
+# [moved vertices, edge points, face points] and 4 * F faces, so the size of the result is known in advance.
+# Open boundaries follow the cubic B-spline rule, like the default subdivision surface modifier.
+# Any per vertex data (positions, weights...) can be subdivided along, uvs are stored per face corner and are
+# interpolated linearly. Closed loops of vertices can be followed through the steps, each step inserting the edge
+# point of every edge of the loop after its first vertex.
+
+import numpy as np
+
+
+def edge_topology(faces, verts_number):
+    """Returns the edges (E, 2) of a quad mesh and the index of the edge going from corner k to corner k + 1 of
+    each face (F, 4)
+    """
+    starts = faces.astype(np.int64)
+    ends = np.roll(starts, -1, axis=1)
+    keys = np.minimum(starts, ends) * verts_number + np.maximum(starts, ends)
+    unique_keys, face_edges = np.unique(keys.ravel(), return_inverse=True)
+    edges = np.stack((unique_keys // verts_number, unique_keys % verts_number), axis=1)
+    return edges, face_edges.reshape(faces.shape)
+
+
+def catmull_clark(data, faces, uvs=None, loops=()):
+    """Subdivides once a quad mesh whose vertices hold data (V, d).
+
+    loops is a list of arrays (m, L) of closed loops of vertices following edges of the mesh.
+    Returns the new data, faces, uvs and loops, the loops having 2L vertices.
+    """
+    data = np.asarray(data, dtype=float)
+    faces = np.asarray(faces)
+    verts_number = len(data)
+    edges, face_edges = edge_topology(faces, verts_number)
+    edges_number = len(edges)
+
+    face_points = data[faces].mean(axis=1)
+    corner_face_points = np.repeat(face_points, 4, axis=0)
+    mids = data[edges].mean(axis=1)
+
+    edge_faces = np.bincount(face_edges.ravel(), minlength=edges_number)[:, None]
+    face_sums = np.zeros((edges_number, data.shape[1]))
+    np.add.at(face_sums, face_edges.ravel(), corner_face_points)
+    boundary = edge_faces[:, 0] == 1
+    edge_points = np.where(boundary[:, None], mids, (mids + face_sums / np.maximum(edge_faces, 1)) / 2)
+
+    valence = np.bincount(edges.ravel(), minlength=verts_number)[:, None]
+    vertex_faces = np.bincount(faces.ravel(), minlength=verts_number)[:, None]
+    face_average = np.zeros_like(data)
+    np.add.at(face_average, faces.ravel(), corner_face_points)
+    face_average /= np.maximum(vertex_faces, 1)
+    mid_average = np.zeros_like(data)
+    np.add.at(mid_average, edges.ravel(), np.repeat(mids, 2, axis=0))
+    mid_average /= np.maximum(valence, 1)
+    n = np.maximum(valence, 1)
+    vertex_points = (face_average + 2 * mid_average + (valence - 3) * data) / n
+
+    boundary_edges = edges[boundary]
+    boundary_count = np.bincount(boundary_edges.ravel(), minlength=verts_number)
+    neighbours = np.zeros_like(data)
+    np.add.at(neighbours, boundary_edges[:, 0], data[boundary_edges[:, 1]])
+    np.add.at(neighbours, boundary_edges[:, 1], data[boundary_edges[:, 0]])
+    on_boundary = boundary_count == 2
+    vertex_points[on_boundary] = .75 * data[on_boundary] + neighbours[on_boundary] / 8
+    # isolated vertices and vertices where several boundaries meet are kept in place
+    fixed = (boundary_count > 2) | (valence[:, 0] < 3) & ~on_boundary
+    vertex_points[fixed] = data[fixed]
+
+    new_data = np.concatenate((vertex_points, edge_points, face_points))
+    edge_indexes = verts_number + face_edges
+    face_indexes = np.repeat((verts_number + edges_number + np.arange(len(faces)))[:, None], 4, axis=1)
+    new_faces = np.stack((faces, edge_indexes, face_indexes, np.roll(edge_indexes, 1, axis=1)), axis=2).reshape(-1, 4)
+
+    new_uvs = None
+    if uvs is not None:
+        uvs = np.asarray(uvs, dtype=float)
+        uv_mids = (uvs + np.roll(uvs, -1, axis=1)) / 2
+        uv_centers = np.repeat(uvs.mean(axis=1)[:, None], 4, axis=1)
+        new_uvs = np.stack((uvs, uv_mids, uv_centers, np.roll(uv_mids, 1, axis=1)), axis=2).reshape(-1, 4, 2)
+
+    edge_keys = edges[:, 0] * verts_number + edges[:, 1]
+    new_loops = []
+    for loop in loops:
+        starts = loop.astype(np.int64)
+        ends = np.roll(starts, -1, axis=1)
+        keys = np.minimum(starts, ends) * verts_number + np.maximum(starts, ends)
+        loop_edges = verts_number + np.searchsorted(edge_keys, keys)
+        new_loops.append(np.stack((loop, loop_edges), axis=2).reshape(len(loop), 2 * loop.shape[1]))
+
+    return new_data, new_faces, new_uvs, new_loops
+
+
+def subdivide(data, faces, uvs=None, levels=1, loops=()):
+    """Applies levels steps of Catmull-Clark subdivision"""
+    loops = list(loops)
+    for i in range(levels):
+        data, faces, uvs, loops = catmull_clark(data, faces, uvs, loops)
+    return data, faces, uvs, loops
+
+
+def label_components(edges, verts_number):
+    """Union-find over edges: returns the label of each vertex, the smallest vertex index of its connected component"""
+    labels = np.arange(verts_number)
+    if len(edges) == 0:
+        return labels
+    while True:
+        # hook the root of each end of an edge on the smallest of the two roots, then compress the paths
+        roots = labels[edges]
+        smallest = roots.min(axis=1)
+        np.minimum.at(labels, roots[:, 0], smallest)
+        np.minimum.at(labels, roots[:, 1], smallest)
+        compressed = labels[labels]
+        while not np.array_equal(compressed, labels):
+            labels = compressed
+            compressed = labels[labels]
+        if np.array_equal(labels[edges[:, 0]], labels[edges[:, 1]]):
+            return labels
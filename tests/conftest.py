@@ -0,0 +1,12 @@
+# The __init__ of the add-on registers it in blender, so the tests import its modules through a package entry that
+# does not run it, and pytest.ini makes this directory the root of the tests so that pytest does not import the
+# add-on either. Only the modules that do not need blender can be tested this way: python -m pytest tests
+
+import os
+import sys
+import types
+
+
+package = types.ModuleType("modular_tree")
+package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+sys.modules.setdefault("modular_tree", package)
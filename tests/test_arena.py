@@ -0,0 +1,110 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from modular_tree import arena
+
+
+class Module:
+    """The fields of a module read by TreeArena.append"""
+    def __init__(self, type, position, head_module_1=None, head_module_2=None):
+        self.type = type
+        self.position = position
+        self.direction = (0, 0, 1)
+        self.base_radius = self.head_1_radius = self.head_2_radius = .5
+        self.head_1_length = self.head_2_length = self.length = 1
+        self.primary_angle = self.secondary_angle = 0
+        self.spin = 0
+        self.creator = "default"
+        self.uid = 0
+        self.resolution = 0
+        self.starting_index = 0
+        self.uv_height = 0
+        self.head_module_1 = head_module_1
+        self.head_module_2 = head_module_2
+
+
+def small_tree():
+    """A root, a branch and a split whose second head carries a branch"""
+    split = Module('split', (0, 0, 2), head_module_2=Module('branch', (0, 0, 3)))
+    tree = arena.TreeArena()
+    root = tree.add(Module('root', (0, 0, 0), head_module_1=Module('branch', (0, 0, 1), head_module_1=split)))
+    return tree, root
+
+
+def test_save_and_load(tmp_path):
+    tree, root = small_tree()
+    path = str(tmp_path / "tree.mtskel")
+    tree.save(path, root)
+    loaded, loaded_root = arena.load(path)
+    assert loaded_root == root and len(loaded) == len(tree)
+    for name in arena.FIELDS:
+        assert np.array_equal(getattr(loaded, name), getattr(tree, name)[:len(tree)])
+    assert loaded.extremities() == tree.extremities()
+
+
+def test_save_over_mapped_file(tmp_path):
+    tree, root = small_tree()
+    path = str(tmp_path / "tree.mtskel")
+    tree.save(path, root)
+    loaded, root = arena.load(path, mmap=True)
+    loaded.save(path, root)
+    reloaded, root = arena.load(path, mmap=False)
+    for name in arena.FIELDS:
+        assert np.array_equal(getattr(reloaded, name), getattr(tree, name)[:len(tree)])
+
+
+def write_header(path, change):
+    """Rewrites the header of a skeleton file after calling change on it, keeping the fields where they are"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    size = struct.unpack('<I', data[len(arena.MAGIC):len(arena.MAGIC) + 4])[0]
+    header = json.loads(data[len(arena.MAGIC) + 4:len(arena.MAGIC) + 4 + size].decode())
+    change(header)
+    new_header = json.dumps(header).encode()
+    new_header += b" " * (size - len(new_header))
+    with open(path, 'wb') as f:
+        f.write(data[:len(arena.MAGIC) + 4] + new_header + data[len(arena.MAGIC) + 4 + size:])
+
+
+def test_load_refuses_invalid_files(tmp_path):
+    tree, root = small_tree()
+    path = str(tmp_path / "tree.mtskel")
+
+    tree.save(path, root)
+    write_header(path, lambda header: header.update(count=10 ** 6))
+    with pytest.raises(ValueError):
+        arena.load(path)
+
+    tree.save(path, root)
+    write_header(path, lambda header: header.update(root=len(tree)))
+    with pytest.raises(ValueError):
+        arena.load(path)
+
+    for key in ("creators", "density"):
+        tree.save(path, root)
+        write_header(path, lambda header: header.pop(key))
+        with pytest.raises(ValueError):
+            arena.load(path)
+
+    tree.save(path, root)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - arena.ALIGNMENT)
+    with pytest.raises(ValueError):
+        arena.load(path)
+
+
+def test_rebuild_frontier_refuses_cycles():
+    tree, root = small_tree()
+    split = int(np.flatnonzero(tree.type[:len(tree)] == arena.SPLIT)[0])
+    # the split links back to the root, which now has it as parent
+    tree.head[split, 0] = root
+    tree.parent[root] = split
+    with pytest.raises(ValueError):
+        tree.rebuild_frontier(root)
+    tree.head[split, 0] = len(tree)
+    with pytest.raises(ValueError):
+        tree.rebuild_frontier(root)
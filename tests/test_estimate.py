@@ -0,0 +1,43 @@
+import numpy as np
+
+from modular_tree import rng
+from modular_tree.cage import build_cage
+from modular_tree.estimate import Forecast
+from modular_tree.growth import add_basic_trunk, add_splits, grow
+from modular_tree.streaming import chunks
+
+
+def grown_tree(seed):
+    """A tree grown without pruning, whose size only depends on the splits drawn"""
+    rng.seed(seed)
+    tree = add_basic_trunk(.8, .97, .1, .7, 0, 10, .9)
+    add_splits(tree, .3, [], "split", 45, 45/180*3.14159, .6, 0)
+    grow(tree, 6, .05, 'iterations', .9, .3, 45, .25, .6, .97, .1, 135, .1, "grow", [], .1, 0, 0, 0, False)
+    return tree
+
+
+def final_size(tree, resolution_levels):
+    verts, faces, uvs, weights, owners, welds, depths = build_cage(tree, resolution_levels)
+    verts_number = faces_number = 0
+    for chunk_verts, chunk_faces, chunk_uvs, chunk_weights, chunk_owners in chunks(verts, faces, uvs, weights, owners,
+                                                                                 welds):
+        verts_number += len(chunk_verts)
+        faces_number += len(chunk_faces)
+    return verts_number, faces_number
+
+
+def test_forecast_matches_grown_trees():
+    for resolution_levels in range(4):
+        forecast = Forecast(resolution_levels)
+        forecast.add_basic_trunk(.8, .97, 10, .9)
+        forecast.add_splits(.3, [], "split", .6)
+        forecast.grow(6, .05, 'iterations', .3, .6, .97, "grow", [])
+        verts, faces = forecast.geometry_size()
+
+        # building a tree corrects its radii, so each level is built on trees grown again
+        trees = [grown_tree(seed) for seed in range(16)]
+        modules = np.mean([tree.arena.alive[:len(tree.arena)].sum() for tree in trees])
+        sizes = np.mean([final_size(tree, resolution_levels) for tree in trees], axis=0)
+        assert .85 < forecast.modules_number / modules < 1.15
+        assert .85 < verts / sizes[0] < 1.15
+        assert .85 < faces / sizes[1] < 1.15
@@ -0,0 +1,78 @@
+import numpy as np
+
+from modular_tree import rng
+from modular_tree.arena import SPLIT
+from modular_tree.cage import build_cage, export_obj
+from modular_tree.growth import add_basic_trunk, add_splits, grow
+
+
+def small_tree():
+    rng.seed(3)
+    tree = add_basic_trunk(.8, .97, .1, .7, 0, 10, .9)
+    add_splits(tree, .3, [], "split", 45, 45/180*3.14159, .6, 0)
+    grow(tree, 3, .05, 'iterations', .9, .3, 45, .25, .6, .97, .1, 135, .1, "grow", [], .1, 1, 1, .5)
+    return tree
+
+
+def read_obj(filepath):
+    verts, faces = [], []
+    with open(filepath) as f:
+        for line in f:
+            if line.startswith("v "):
+                verts.append([float(x) for x in line.split()[1:]])
+            elif line.startswith("f "):
+                faces.append([int(corner.split("/")[0]) - 1 for corner in line.split()[1:]])
+    return np.array(verts).reshape(-1, 3), np.array(faces, dtype=int).reshape(-1, 4)
+
+
+def test_growth_is_reproducible():
+    first, second = small_tree(), small_tree()
+    assert len(first.arena) == len(second.arena)
+    assert (first.arena.type[:len(first.arena)] == SPLIT).any()
+    assert np.array_equal(first.arena.position[:len(first.arena)], second.arena.position[:len(second.arena)])
+    assert np.array_equal(first.arena.uid[:len(first.arena)], second.arena.uid[:len(second.arena)])
+
+
+def test_splits_keep_the_whole_trunk():
+    for seed in range(8):
+        rng.seed(seed)
+        tree = add_basic_trunk(.8, .97, .1, .7, 0, 10, .9)
+        trunk = len(tree.arena)
+        # small heads skip no branch, so each split only replaces the branch it is drawn on
+        add_splits(tree, .9, [], "split", 45, 45/180*3.14159, .3, 0)
+        arena = tree.arena
+        alive = arena.alive[:len(arena)]
+        assert alive.sum() == trunk
+        assert (alive & (arena.type[:len(arena)] == SPLIT)).sum() > 1
+
+
+def test_grown_modules_start_at_the_heads_of_their_parents():
+    arena = small_tree().arena
+    modules = np.flatnonzero(arena.parent[:len(arena)] >= 0)
+    parents = arena.parent[modules]
+    heads = (arena.head[parents, 1] == modules).astype(int)
+    positions, directions = arena.head_frames(parents, heads)
+    grown = arena.creator[modules] == arena.creator_code("grow")
+    assert np.allclose(arena.position[modules][grown], positions[grown], atol=1e-5)
+
+
+def test_build_cage_and_export(tmp_path):
+    tree = small_tree()
+    verts, faces, uvs, weights, owners, welds, depths = build_cage(tree, 2)
+    for level_verts, level_faces in zip(verts, faces):
+        assert len(level_faces) == 0 or level_faces.max() < len(level_verts)
+
+    filepath = str(tmp_path / "tree.obj")
+    export_obj(tree, 2, filepath, chunk_size=1000)
+    obj_verts, obj_faces = read_obj(filepath)
+    assert len(obj_faces) > sum(len(level_faces) for level_faces in faces)
+    assert obj_faces.min() >= 0 and obj_faces.max() < len(obj_verts)
+
+
+def test_export_lone_root(tmp_path):
+    tree = add_basic_trunk(1, .97, .1, .7, 0, 0, 1)
+    assert len(tree.arena) == 1
+    filepath = str(tmp_path / "root.obj")
+    export_obj(tree, 2, filepath)
+    obj_verts, obj_faces = read_obj(filepath)
+    assert len(obj_faces) == 0
@@ -0,0 +1,74 @@
+from collections import Counter
+
+import numpy as np
+
+from modular_tree import rng
+from modular_tree.cage import build_cage
+from modular_tree.growth import add_basic_trunk, add_splits, grow
+from modular_tree.streaming import chunks
+
+
+def grown_tree():
+    rng.seed(3)
+    tree = add_basic_trunk(.8, .97, .1, .7, 0, 10, .9)
+    add_splits(tree, .3, [], "split", 45, 45/180*3.14159, .6, 0)
+    grow(tree, 3, .05, 'iterations', .9, .3, 45, .25, .6, .97, .1, 135, .1, "grow", [], .1, 1, 1, .5)
+    return tree
+
+
+def final_mesh(resolution_levels, chunk_size=0):
+    """Returns the verts, faces, uvs and weights of the final mesh of the grown tree and the number of chunks"""
+    verts, faces, uvs, weights, owners, welds, depths = build_cage(grown_tree(), resolution_levels)
+    parts = list(chunks(verts, faces, uvs, weights, owners, welds, chunk_size))
+    verts, faces, uvs, weights = [np.concatenate([part[i] for part in parts]) for i in range(4)]
+    return verts, faces, uvs, weights, len(parts)
+
+
+def directed_edges(faces):
+    return np.stack((faces, np.roll(faces, -1, axis=1)), axis=2).reshape(-1, 2)
+
+
+def test_mesh_is_closed_but_the_trunk_base():
+    for resolution_levels in range(4):
+        verts, faces, uvs, weights, chunks_number = final_mesh(resolution_levels)
+        edges = Counter(map(tuple, np.sort(directed_edges(faces), axis=1).tolist()))
+        assert max(edges.values()) == 2
+        boundary = np.array([edge for edge, count in edges.items() if count == 1])
+        # the base of the trunk is the ring of the root, subdivided at the highest level
+        assert len(boundary) == 4 * 2 ** resolution_levels
+        assert np.allclose(verts[boundary, 2], 0)
+
+
+def test_faces_are_wound_outward():
+    for resolution_levels in range(4):
+        verts, faces, uvs, weights, chunks_number = final_mesh(resolution_levels)
+        # two faces going the same way along an edge would have opposite windings
+        edges = Counter(map(tuple, directed_edges(faces).tolist()))
+        assert max(edges.values()) == 1
+        # the trunk base is open but lies in the plane z = 0, so it adds nothing to the volume
+        a, b, c, d = [verts[faces[:, i]].astype(float) for i in range(4)]
+        volume = (np.einsum('ij,ij->i', a, np.cross(b, c)) + np.einsum('ij,ij->i', a, np.cross(c, d))).sum() / 6
+        assert volume > 0
+
+
+def test_transitions_are_welded_to_their_parents():
+    for resolution_levels in (2, 3):
+        verts, faces, uvs, weights, owners, welds, depths = build_cage(grown_tree(), resolution_levels)
+        assert sum(len(octagons) for parent_levels, rings, levels, octagons in welds) > 0
+        verts, faces, uvs, weights, chunks_number = final_mesh(resolution_levels)
+        # the octagon of a transition reuses the head ring of its parent, so no two vertices share a position
+        assert len(np.unique(np.round(verts, 4), axis=0)) == len(verts)
+
+
+def test_chunk_size_does_not_change_the_mesh():
+    for resolution_levels in range(4):
+        verts, faces, uvs, weights, chunks_number = final_mesh(resolution_levels)
+        for chunk_size in (50, 1000):
+            chunked = final_mesh(resolution_levels, chunk_size)
+            assert len(chunked[0]) == len(verts) and len(chunked[1]) == len(faces)
+            # the vertices are numbered in chunk order, so the faces are compared through their corners
+            assert np.allclose(chunked[0].sum(axis=0), verts.sum(axis=0), atol=1e-2)
+            assert np.allclose(chunked[0][chunked[1]].sum(axis=(0, 1)), verts[faces].sum(axis=(0, 1)), atol=1e-2)
+            assert np.isclose(chunked[2].sum(), uvs.sum(), atol=1e-2)
+            assert np.isclose(chunked[3].sum(), weights.sum(), atol=1e-2)
+    assert final_mesh(3, 50)[4] > final_mesh(3)[4]
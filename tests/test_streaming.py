@@ -0,0 +1,72 @@
+import numpy as np
+
+from modular_tree import streaming
+
+
+class Collection:
+    """Records what is written to a collection of a mesh datablock"""
+    def __init__(self):
+        self.length = 0
+        self.values = {}
+
+    def __len__(self):
+        return self.length
+
+    def add(self, count):
+        self.length += count
+
+    def foreach_set(self, attribute, values):
+        self.values[attribute] = np.array(values)
+
+
+class UvTextures:
+    """Creating a uv texture creates the uv layer of the same name"""
+    def __init__(self, uv_layers):
+        self.uv_layers = uv_layers
+
+    def new(self, name):
+        self.uv_layers[name] = type("UvLayer", (), {"data": Collection()})()
+
+
+class Mesh:
+    def __init__(self):
+        self.vertices = Collection()
+        self.loops = Collection()
+        self.polygons = Collection()
+        self.uv_layers = {}
+        self.uv_textures = UvTextures(self.uv_layers)
+
+    def update(self, calc_edges=False):
+        pass
+
+    def validate(self):
+        pass
+
+
+def quad_level():
+    verts = [np.array([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)], dtype=float)]
+    faces = [np.array([(0, 1, 2, 3)])]
+    uvs = [np.zeros((1, 4, 2))]
+    weights = [np.ones(4)]
+    owners = [np.array([1])]
+    return verts, faces, uvs, weights, owners
+
+
+def test_mesh_sink_writes_chunks():
+    mesh = Mesh()
+    verts, faces, weights, owners = streaming.assemble(streaming.chunks(*quad_level()), streaming.MeshSink(mesh))
+    assert len(mesh.vertices) == len(verts) == 4
+    assert len(mesh.polygons) == len(faces) == 1
+    assert np.array_equal(owners, [1, 1, 1, 1])
+
+
+def test_mesh_sink_without_faces():
+    # a root without any module has vertices but no face, so no chunk is made
+    verts, faces, uvs, weights, owners = quad_level()
+    faces, uvs, owners = [np.zeros((0, 4), dtype=int)], [np.zeros((0, 4, 2))], [np.zeros(0, dtype=int)]
+    mesh = Mesh()
+    verts, faces, weights, owners = streaming.assemble(streaming.chunks(verts, faces, uvs, weights, owners),
+                                                       streaming.MeshSink(mesh))
+    assert len(mesh.vertices) == len(mesh.polygons) == 0
+    assert verts.shape == (0, 3) and faces.shape == (0, 4)
+    assert len(weights) == len(owners) == 0
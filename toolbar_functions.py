@@ -1,6 +1,9 @@
 import bpy
 import os
+import numpy as np
 from .tree_functions import create_twig
+from .mesh_writer import write_vertex_group
+from . import datablocks
 from math import pi
 from mathutils import Euler
 from bpy.types import Operator
@@ -12,20 +15,21 @@ def add_trunk_weight(obj, height, power=1.5):
     if vg is not None:
         obj.vertex_groups.remove(vg)
 
-    vg = obj.vertex_groups.new("base_trunk_displace")
-    verts = obj.data.vertices
-    faces = obj.data.polygons
-    verts_indexes = set()
-    for f in faces:
-        if f.center.z > height * 1.1:
-            break
+    mesh = obj.data
+    centers = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("center", centers)
+    above = centers[2::3] > height * 1.1
+    faces_number = np.argmax(above) if above.any() else len(above)
+    loops_number = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loops_number)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    verts_indexes = np.unique(loops[:loops_number[:faces_number].sum()])
 
-        for v in f.vertices:
-            verts_indexes.add(v)
-
-    for v in verts_indexes:
-        weight = max(0, 1 - verts[v].co.z / height)**power
-        vg.add([v], weight, 'REPLACE')
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    weights = np.maximum(0, 1 - co[2::3][verts_indexes] / height)**power
+    write_vertex_group(obj, "base_trunk_displace", weights, verts_indexes)
 
 
 class TrunkDisplacement(Operator):
@@ -58,13 +62,20 @@ class TrunkDisplacement(Operator):
             message = "no object selected"
         if obj.get("is_tree") is None:
             message = "no tree selected"
-        elif obj["tree_type"] == "curve":
-            message = "this operator only works on objects, not curves."
+        elif obj["tree_type"] != "object":
+            message = "this operator only works on objects, not previews."
         if message is not None:
             self.report({'ERROR'}, message)
             return {'CANCELLED'}
 
         add_trunk_weight(obj, self.height, self.power)
+        # running the operator again replaces the displacement, the texture and the empty of the previous run
+        disp = obj.modifiers.get('trunk displace')
+        if disp is not None:
+            empt = disp.texture_coords_object
+            obj.modifiers.remove(disp)
+            if empt is not None and empt.name in obj.get(datablocks.PROPERTY, {}).get("objects", {}):
+                bpy.context.scene.objects.unlink(empt)
         disp = obj.modifiers.new(type='DISPLACE', name='trunk displace')
         disp.vertex_group = "base_trunk_displace"
 
@@ -90,6 +101,10 @@ class TrunkDisplacement(Operator):
 
         disp.texture = tex
         disp.strength = self.displace_strength
+        datablocks.own(obj, tex, disp.texture_coords_object)
+        count, size = datablocks.reclaim(obj)
+        if count > 0:
+            self.report({'INFO'}, "released {} datablocks ({} bytes)".format(count, size))
 
         return {'FINISHED'}
 
@@ -0,0 +1,116 @@
+# Faces and uvs of the modules are generated from templates precompiled for each module type, base ring roll and
+# combination of capped heads. In a template, vertex k < 4 is the k-th vertex of the ring the module is built on,
+# and vertex 4 + j is the j-th vertex of the module itself.
+# Faces are wound counterclockwise seen from outside, so that normals point outwards without any recalculation.
+
+import numpy as np
+
+from .arena import BRANCH, SPLIT, TRANSITION
+
+
+# ring faces go from the base of their column to the next column, then up to the head
+RING_FACES = {BRANCH: [(0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7)],
+              SPLIT: [(0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 11, 10, 7), (8, 0, 4, 9), (10, 9, 4, 7), (3, 0, 8, 11)]}
+CAP_FACES = {BRANCH: [(4, 5, 6, 7)],
+             SPLIT: [(4, 5, 6, 7), (8, 9, 10, 11)],
+             TRANSITION: [(12, 13, 14, 15)]}
+CAP_UVS = [(0, 0), (0, 1), (1, 1), (1, 0)]
+# head whose uv length is used by each ring face, and column of the face around the ring
+RING_HEADS = {BRANCH: [0, 0, 0, 0],
+              SPLIT: [0, 0, 0, 1, 1, 1, 1]}
+RING_COLUMNS = {BRANCH: [0, 1, 2, 3],
+                SPLIT: [0, 1, 2, 0, 1, 2, 3]}
+
+MAX_FACES = 9
+LOCAL_VERTS = 18
+
+
+def transition_corners():
+    """Returns the faces of a transition as lists of (vertex, u, uv length factor) corners.
+
+    A transition goes from its octagonal base (vertices 4 to 11) to its square head (12 to 15) with quads only, using
+    one middle vertex (16 and 17) for each half of the tube. Its faces do not use the ring it is built on, which is in
+    another resolution level.
+    """
+    faces = []
+    for half in range(2):
+        a = [(4 + (4*half + i) % 8, (4*half + i) / 8, 0) for i in range(5)]
+        t = [(12 + (2*half + i) % 4, (2*half + i) / 4, 1) for i in range(3)]
+        m = (16 + half, (4*half + 2) / 8, .5)
+        faces += [(a[0], a[1], m, t[0]), (a[1], a[2], a[3], m), (a[3], a[4], t[2], m), (m, t[2], t[1], t[0])]
+    return faces
+
+
+class Template:
+    def __init__(self, module_type, variant, caps):
+        """variant is the roll of the base ring (0 to 3, unused by transitions), caps has bit h set when head h is
+        capped"""
+        faces = []
+        uv_base = []
+        uv_height = []
+        uv_length = []
+        if module_type == TRANSITION:
+            for corners in transition_corners():
+                faces.append(tuple(vertex for vertex, u, length in corners))
+                uv_base.append([(u, 0) for vertex, u, length in corners])
+                uv_height.append([1, 1, 1, 1])
+                uv_length.append([(length, 0) for vertex, u, length in corners])
+        else:
+            base = [(k - variant) % 4 for k in range(4)]
+            faces = [tuple(base[i] if i < 4 else i for i in face) for face in RING_FACES[module_type]]
+            for column, head in zip(RING_COLUMNS[module_type], RING_HEADS[module_type]):
+                uv_base.append([(column / 4, 0), ((column + 1) / 4, 0), ((column + 1) / 4, 0), (column / 4, 0)])
+                uv_height.append([1, 1, 1, 1])
+                length = (int(head == 0), int(head == 1))
+                uv_length.append([(0, 0), (0, 0), length, length])
+        for head, cap in enumerate(CAP_FACES[module_type]):
+            if caps & (1 << head):
+                faces.append(cap)
+                uv_base.append(CAP_UVS)
+                uv_height.append([0, 0, 0, 0])
+                uv_length.append([(0, 0)] * 4)
+
+        self.faces = np.array(faces, dtype=int)
+        self.uv_base = np.array(uv_base, dtype=float)
+        self.uv_height = np.array(uv_height, dtype=float)
+        self.uv_length = np.array(uv_length, dtype=float)
+
+    def __len__(self):
+        return len(self.faces)
+
+
+TEMPLATES = {}
+for variant in range(4):
+    for caps in range(4):
+        TEMPLATES[(SPLIT, variant, caps)] = Template(SPLIT, variant, caps)
+for variant in range(4):
+    for caps in range(2):
+        TEMPLATES[(BRANCH, variant, caps)] = Template(BRANCH, variant, caps)
+for caps in range(2):
+    TEMPLATES[(TRANSITION, 0, caps)] = Template(TRANSITION, 0, caps)
+
+
+def build_topology(types, variants, caps, rings, starts, uv_heights, uv_lengths):
+    """Returns the faces (n, MAX_FACES, 4), uvs (n, MAX_FACES, 4, 2) and faces number of a batch of modules.
+
+    rings holds the indexes of the rings the modules are built on, starts the index of their first vertex and
+    uv_lengths the uv length of each of their heads.
+    """
+    n = len(types)
+    faces = np.zeros((n, MAX_FACES, 4), dtype=int)
+    uvs = np.zeros((n, MAX_FACES, 4, 2))
+    faces_number = np.zeros(n, dtype=int)
+    local = np.concatenate((rings, starts[:, None] + np.arange(LOCAL_VERTS - 4)), axis=1)
+
+    keys = (types.astype(int) * 8 + variants) * 4 + caps
+    for key in np.unique(keys):
+        rows = keys == key
+        template = TEMPLATES[(key // 32, key // 4 % 8, key % 4)]
+        size = len(template)
+        faces[rows, :size] = local[rows][:, template.faces]
+        v = template.uv_height * uv_heights[rows, None, None] + np.einsum('fch,nh->nfc', template.uv_length, uv_lengths[rows])
+        uvs[rows, :size] = template.uv_base
+        uvs[rows, :size, :, 1] += v
+        faces_number[rows] = size
+    return faces, uvs, faces_number
+
@@ -0,0 +1,86 @@
+# Iterative walks over a module graph. Explicit stacks are used instead of recursion so that trees of any depth
+# can be walked. The walks only rely on the head_module_1 / head_module_2 links, so they work on plain modules
+# as well as on TreeArena views.
+
+from collections import deque
+
+
+def selection_test(root, selection):
+    """Returns a function telling if a module of the tree of root was made by a creator of selection.
+
+    selection is a list of creator names, empty or None selecting everything. For arena trees the names are
+    turned once into a bitmask of creator ids, so that no string is compared per module.
+    """
+    if selection is None or len(selection) == 0:
+        return lambda module: True
+    arena = getattr(root, "arena", None)
+    if arena is None:
+        names = set(selection)
+        return lambda module: module.creator in names
+    mask = arena.creator_mask(selection)
+    return lambda module: mask >> int(arena.creator[module.index]) & 1 == 1
+
+
+def heads(module):
+    """Returns the (head, module) pairs of the modules linked to the heads of module"""
+    result = []
+    if module.head_module_1 is not None:
+        result.append((0, module.head_module_1))
+    if module.head_module_2 is not None:
+        result.append((1, module.head_module_2))
+    return result
+
+
+def preorder(root, selection=None):
+    """Yields (module, parent, head) for every module, parents first, head 1 subtrees before head 2 subtrees"""
+    is_selected = selection_test(root, selection)
+    stack = [(root, None, 0)]
+    while len(stack) > 0:
+        module, parent, head = stack.pop()
+        for child_head, child in reversed(heads(module)):
+            stack.append((child, module, child_head))
+        if is_selected(module):
+            yield module, parent, head
+
+
+def postorder(root, selection=None):
+    """Yields (module, parent, head) for every module, children first"""
+    is_selected = selection_test(root, selection)
+    stack = [(root, None, 0, False)]
+    while len(stack) > 0:
+        module, parent, head, expanded = stack.pop()
+        if expanded:
+            if is_selected(module):
+                yield module, parent, head
+        else:
+            stack.append((module, parent, head, True))
+            for child_head, child in reversed(heads(module)):
+                stack.append((child, module, child_head, False))
+
+
+def levelorder(root, selection=None):
+    """Yields (module, parent, head) for every module, one depth after the other"""
+    is_selected = selection_test(root, selection)
+    queue = deque([(root, None, 0)])
+    while len(queue) > 0:
+        module, parent, head = queue.popleft()
+        for child_head, child in heads(module):
+            queue.append((child, module, child_head))
+        if is_selected(module):
+            yield module, parent, head
+
+
+def walk(root, visit, state=None):
+    """Depth first walk where each step decides where to go next.
+
+    visit(module, state) returns the (module, state) pairs to visit next. Each of them is walked entirely
+    before the following one, and None modules are skipped.
+    """
+    stack = [(root, state)] if root is not None else []
+    while len(stack) > 0:
+        module, state = stack.pop()
+        children = visit(module, state)
+        if children:
+            for child in reversed(list(children)):
+                if child[0] is not None:
+                    stack.append(child)